@@ -0,0 +1,161 @@
+import os
+import numpy as np
+
+from setup_paths import *
+import measurement
+import visu_common
+import model_fit
+
+class ActivePlanner():
+    '''Proposes the (m7, m4, size) points whose measurement improves the
+        linear model the most, based on the parameter uncertainty and the
+        residuals of the measured points'''
+    def __init__(self, candidates, ridge=1e-9):
+        '''
+        Args:
+            candidates: list of (m7, m4, size) points that can be measured
+            ridge: regularization of the information matrix before enough
+                points are measured'''
+        self.candidates = np.array(candidates, dtype=float).reshape((-1, 3))
+        self.candidate_rows = model_fit.design_matrix(*self.candidates.T)
+        self.ridge = ridge
+        self.points = np.empty((0, 3))
+        self.latencies = np.empty(0)
+        self.params = None
+        self.residuals = np.empty(0)
+
+    def add(self, m7, m4, size, latency):
+        '''Adds a measured mean latency [us] and refits the model'''
+        self.points = np.vstack((self.points, (m7, m4, size)))
+        self.latencies = np.append(self.latencies, latency)
+        self.fit()
+
+    def fit(self):
+        '''Fits the model to the measured points, like the regression
+            notebook with non-negative parameters'''
+        if len(self.points) < 4:
+            return
+        K = model_fit.design_matrix(*self.points.T)
+        self.params = model_fit.fit_batch({0: (K, self.latencies)})[0]
+        self.residuals = self.latencies - K @ self.params
+
+    def _scores(self, information):
+        '''Expected gain of each candidate, relative prediction variance plus
+            the misfit of the measured points with the same size'''
+        rows = self.candidate_rows
+        if self.params is None: # not fitted yet, pure D-optimal choice
+            rows = rows / np.linalg.norm(rows, axis=1)[:, np.newaxis]
+            cov = np.linalg.inv(information + self.ridge * np.eye(4))
+            return np.einsum('ij,jk,ik->i', rows, cov, rows)
+        dof = max(len(self.points) - 4, 1)
+        sigma2 = np.sum(np.square(self.residuals)) / dof
+        cov = sigma2 * np.linalg.inv(information + self.ridge * np.eye(4))
+        variance = np.einsum('ij,jk,ik->i', rows, cov, rows)
+        # misfit along the size axis, the model can not be improved by
+        # measuring there, but it shows where the model is wrong
+        misfit = np.zeros(len(rows))
+        for size in np.unique(self.points[:, 2]):
+            same_size = self.points[:, 2] == size
+            misfit[self.candidates[:, 2] == size] = \
+                np.mean(np.square(self.residuals[same_size]))
+        pred = rows @ self.params
+        return (variance + misfit) / np.maximum(pred, 1e-12)**2
+
+    def propose(self, num_points=1):
+        '''Returns the next points to be measured, chosen greedily, each
+            chosen point is treated as measured for the next choice
+        Returns: list of (m7, m4, size) tuples'''
+        measured = {tuple(point) for point in self.points}
+        available = np.array([tuple(c) not in measured for c in self.candidates])
+        K = model_fit.design_matrix(*self.points.T)
+        information = K.T @ K
+        chosen = []
+        for _ in range(num_points):
+            if not np.any(available):
+                break
+            scores = np.where(available, self._scores(information), -np.inf)
+            best = int(np.argmax(scores))
+            available[best] = False
+            information += np.outer(self.candidate_rows[best],
+                                    self.candidate_rows[best])
+            m7, m4, size = self.candidates[best]
+            chosen.append((int(m7), int(m4), int(size)))
+        return chosen
+
+def run_active(planner, measure_point, budget, batch=1):
+    '''Acquisition loop measuring the proposed points until the budget
+    Args:
+        planner: ActivePlanner
+        measure_point: function (m7, m4, size) -> mean latency [us]
+        budget: number of points measured
+        batch: number of points proposed at once
+    Returns: the fitted model parameters'''
+    measured = 0
+    while measured < budget:
+        points = planner.propose(min(batch, budget - measured))
+        if not points:
+            break
+        for m7, m4, size in points:
+            planner.add(m7, m4, size, measure_point(m7, m4, size))
+        measured += len(points)
+    return planner.params
+
+def session_measure_point(session, mem, direction, num_meas, clocks,
+                          measurements_path=MEASUREMENTS_PATH):
+    '''Returns a measure_point function for run_active measuring on an open
+        MeasSession, the results are written to the usual folder layout,
+        the planner's candidates should only hold the clocks of the board
+    Args:
+        clocks: (m7, m4) the board is running with
+    Raises: ValueError from measure_point for a point of other clocks,
+        its results would be written to the folder of the wrong clocks'''
+    def measure_point(m7, m4, size):
+        if (m7, m4) != tuple(clocks):
+            raise ValueError(f'point of {m7}_{m4} proposed, the board runs '
+                             f'with {clocks[0]}_{clocks[1]}')
+        response = session.measure(num_meas, size, direction)
+        dir_prefix = os.path.join(measurements_path, mem,
+                                  f'meas_{direction}_{m7}_{m4}')
+        os.makedirs(dir_prefix, exist_ok=True)
+        measurement.write_meas_to_file(dir_prefix, response, size, num_meas,
+                                       m4, direction)
+        # timer clock is always the same as the m4 core's clock
+        return measurement.get_and_calc_meas(m4, dir_prefix, [size],
+                                             'latency')[0, 0]
+    return measure_point
+
+def add_measured(planner, mem, direction, measurements_path=MEASUREMENTS_PATH,
+                 clock_lambda=lambda m7, m4: True):
+    '''Adds the already measured points of mem and direction to the planner'''
+    mem_path = os.path.join(measurements_path, mem)
+    clocks = visu_common.get_clocks_in_folder(
+        mem_path, prefix=f'meas_{direction}_', clock_lambda=clock_lambda)
+    for m7, m4 in clocks:
+        dir_prefix = os.path.join(mem_path, f'meas_{direction}_{m7}_{m4}')
+        sizes = sorted(visu_common.get_sizes(dir_prefix))
+        means = measurement.get_and_calc_meas(m4, dir_prefix, sizes,
+                                              'latency')[0]
+        planner.points = np.vstack((planner.points,
+                                    [(m7, m4, size) for size in sizes]))
+        planner.latencies = np.append(planner.latencies, means)
+    planner.fit()
+
+def main():
+    '''Proposing the next points to be measured for a memory'''
+    #config begin
+    mem = 'D1'
+    direction = 's'
+    sizes = [1 if x==0 else 1024*x for x in range(16)] + [16380]
+    clocks = [(m7, m4) for m7 in range(60, 481, 60)
+              for m4 in range(60, 241, 60) if m4 < m7]
+    num_points = 10
+    #config end
+    candidates = [(m7, m4, size) for m7, m4 in clocks for size in sizes]
+    planner = ActivePlanner(candidates)
+    add_measured(planner, mem, direction)
+    print(f'{len(planner.points)} measured points, params: {planner.params}')
+    for point in planner.propose(num_points):
+        print(point)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from setup_paths import *
+import measurement
+import model_fit
+
+# parameters of the synthetic linear model per mem, same order as the
+# model: m7 const, m7 variable, m4 variable, m4 const [clk]
+SYNTHETIC_PARAMS = {
+    'D1': [1200, 12, 6, 900],
+    'D2': [1300, 14, 7, 1000],
+    'D3': [1500, 18, 9, 1100],
+    'D1_idcache_mpu_ncacheable': [600, 8, 4, 700],
+    'D2_idcache_mpu_ncacheable': [650, 9, 4, 750],
+    'D3_idcache_mpu_ncacheable': [700, 10, 5, 800],
+    'D3_idcache_mpu_ncacheable_release': [400, 6, 3, 500],
+}
+# clocks and sizes read by the final figures
+FIGURE_CLOCKS = [(120, 60), (240, 60), (480, 60), (240, 120), (240, 240),
+                 (480, 240)] + [(m7, m4) for m7 in range(120, 481, 120)
+                                for m4 in range(60, 241, 60) if m4 <= m7]
+SHORT_SIZES = [1 if x==0 else 16*x for x in range(17)]
+FIGURE_SIZES = [4096, 16380]
+HISTOGRAM_MEM = 'D3_idcache_mpu_ncacheable_release'
+HISTOGRAM_CLK = (480, 240)
+STAMP_FILE = 'synthetic.json'
+
+def synthetic_clocks(num_clocks, seed=0):
+    '''Returns the figure clocks and num_clocks random (m7, m4) pairs'''
+    rng = np.random.default_rng(seed)
+    grid = [(m7, m4) for m7 in range(60, 481) for m4 in range(60, 241)
+            if m4 <= m7 and (m7, m4) not in FIGURE_CLOCKS]
+    picked = rng.choice(len(grid), size=min(num_clocks, len(grid)),
+                        replace=False)
+    return FIGURE_CLOCKS + sorted(grid[i] for i in picked)
+
+def synthetic_sizes(num_sizes):
+    '''Returns the short sizes and num_sizes sizes up to 16380 in steps of
+        64, so both size plots of the figures have points'''
+    long_sizes = np.linspace(0, 16320, num_sizes) // 64 * 64
+    return sorted(set(SHORT_SIZES) | set(FIGURE_SIZES)
+                  | {max(1, int(size)) for size in long_sizes})
+
+def synthetic_samples(params, m7, m4, size, num_meas, rng, noise_std=2.0,
+                      outlier_prob=1e-3, outlier_scale=200.0):
+    '''Latencies in timer clks from the linear model with noise and
+        outliers, the timer runs on the m4 clock'''
+    latency = float(model_fit.design_matrix([m7], [m4], [size])[0] @ params)
+    samples = rng.normal(latency * m4, noise_std, num_meas)
+    outliers = rng.random(num_meas) < outlier_prob
+    samples[outliers] += rng.exponential(outlier_scale,
+                                         np.count_nonzero(outliers))
+    return np.maximum(np.rint(samples), 1).astype(np.uint32)
+
+def write_synthetic_file(dir_prefix, samples, size, timer_clock, direction):
+    '''Writes the samples in the format of write_meas_to_file'''
+    num_meas = len(samples)
+    with open(os.path.join(dir_prefix, f'meas{size}.log'), 'wb') as file:
+        file.write(measurement.meas_header(size, num_meas, timer_clock,
+                                           direction))
+        file.write(f'{direction}\r\n{num_meas}\r\r\n{size}\r\r\n'
+                   .encode('ascii'))
+        file.write('\r\n'.join(map(str, samples.tolist())).encode('ascii'))
+        file.write(b'\r\n')
+
+def _generate_folder(dir_prefix, params, direction, m7, m4, sizes, num_meas,
+                     seed):
+    '''Writes every size of one clock folder'''
+    rng = np.random.default_rng(seed)
+    os.makedirs(dir_prefix, exist_ok=True)
+    for size in sizes:
+        samples = synthetic_samples(params, m7, m4, size, num_meas, rng)
+        write_synthetic_file(dir_prefix, samples, size, m4, direction)
+
+def generate_campaign(root, num_clocks=24, num_sizes=32, num_meas=1024,
+                      mems=None, seed=0, workers=None):
+    '''Generates a synthetic campaign in the folder layout of the
+        measurements, including the pilot folder of the histogram figure,
+        an existing campaign with the same config is kept
+    Args:
+        root: root folder, the measurements are in root/measurements
+        num_clocks: number of random clocks besides the figure clocks
+        num_sizes: number of long sizes besides the short sizes
+        num_meas: number of samples in each file
+        mems: names of the mems, every mem of SYNTHETIC_PARAMS if None
+        workers: number of processes writing the folders
+    Returns: True if the campaign was generated, False if it was kept'''
+    mems = list(SYNTHETIC_PARAMS) if mems is None else mems
+    config = {'num_clocks': num_clocks, 'num_sizes': num_sizes,
+              'num_meas': num_meas, 'mems': mems, 'seed': seed}
+    stamp_path = os.path.join(root, STAMP_FILE)
+    try:
+        with open(stamp_path, 'r') as file:
+            if json.load(file) == config:
+                return False
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    measurements_path = os.path.join(root, 'measurements')
+    clocks = synthetic_clocks(num_clocks, seed)
+    sizes = synthetic_sizes(num_sizes)
+    jobs = [(os.path.join(measurements_path, mem, f'meas_{direction}_{m7}_{m4}'),
+             SYNTHETIC_PARAMS[mem], direction, m7, m4, sizes)
+            for mem in mems for direction in ['r', 's'] for m7, m4 in clocks]
+    m7, m4 = HISTOGRAM_CLK
+    jobs += [(os.path.join(measurements_path, 'pilot', HISTOGRAM_MEM,
+                           f'meas_{direction}_{m7}_{m4}'),
+              SYNTHETIC_PARAMS[HISTOGRAM_MEM], direction, m7, m4, [256, 16380])
+             for direction in ['r', 's']]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_generate_folder, *job, num_meas, seed + i)
+                   for i, job in enumerate(jobs)]
+        for future in futures:
+            future.result()
+    os.makedirs(os.path.join(root, 'models'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'figures'), exist_ok=True)
+    with open(stamp_path, 'w') as file:
+        json.dump(config, file)
+    return True
+
+def _time(func, repeat):
+    '''Wall clock times of repeated calls of func [s]'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': float(np.median(times)),
+            'repeat': repeat}
+
+def run_suite(repeat=3, mem='D1', direction='s', latency_clocks=16):
+    '''Times the pipeline on the data of the setup paths, run it with
+        IPC_VISU_ROOT pointing to a synthetic root
+    Args:
+        repeat: number of timed calls of each case
+        mem, direction: data of the reading and aggregation cases
+        latency_clocks: number of clocks read by get_all_latencies
+    Returns: dict of the case name to the timings'''
+    import visu_common
+    import figure_build
+    import final_visu
+
+    mem_path = os.path.join(MEASUREMENTS_PATH, mem)
+    clocks = visu_common.get_clocks_in_folder(mem_path,
+                                              prefix=f'meas_{direction}_')
+    dir_prefixes = [os.path.join(mem_path, f'meas_{direction}_{m7}_{m4}')
+                    for m7, m4 in clocks]
+    sizes = sorted(visu_common.get_sizes(dir_prefixes[0]))
+
+    def read_all(use_cache):
+        for dir_prefix in dir_prefixes:
+            measurement.read_meas_from_files(sizes, dir_prefix,
+                                             use_cache=use_cache)
+
+    def calc_all():
+        measurement._summary_cache.clear() # only the reduction is timed
+        for dir_prefix, (_, m4) in zip(dir_prefixes, clocks):
+            measurement.get_and_calc_meas(m4, dir_prefix, sizes, 'latency',
+                                          if_persistent=False)
+
+    cases = {
+        'read_meas_from_files': lambda: read_all(False),
+        'read_meas_from_files_cached': lambda: read_all(True),
+        'get_and_calc_meas': calc_all,
+        'get_all_latencies': lambda: measurement.get_all_latencies(
+            clocks[:latency_clocks], sizes,
+            dir_prefix_without_clk=os.path.join(mem_path, f'meas_{direction}_')),
+        'fit_models': lambda: model_fit.fit_models(final_visu.MODEL_PATH),
+        'final_visu': lambda: figure_build.build(final_visu.TARGETS,
+                                                 if_force=True),
+    }
+    read_all(True) # fills the cache of the cached case
+    model_fit.fit_models(final_visu.MODEL_PATH) # the figures need the model
+    timings = {}
+    for name, func in cases.items():
+        timings[name] = _time(func, repeat)
+        print(f'{name}: {timings[name]["min"]:.3f} s')
+    return timings
+
+def compare(results, baseline, tolerance=0.1):
+    '''Compares the min times with the baseline
+    Args:
+        results, baseline: dicts written by main
+        tolerance: allowed relative slowdown
+    Returns: list of the names of the regressed cases'''
+    regressed = []
+    for name, timing in results['timings'].items():
+        if name not in baseline['timings']:
+            print(f'{name}: not in the baseline')
+            continue
+        ratio = timing['min'] / baseline['timings'][name]['min']
+        if_regressed = ratio > 1 + tolerance
+        print(f'{name}: {ratio:.2f}x of the baseline'
+              f'{" REGRESSED" if if_regressed else ""}')
+        if if_regressed:
+            regressed.append(name)
+    if results['campaign'] != baseline['campaign']:
+        print('the campaign differs from the baseline, ratios are not comparable')
+    return regressed
+
+def main():
+    '''Generating the synthetic campaign, timing the pipeline on it and
+        comparing the results with the baseline'''
+    #config begin
+    root = os.path.join(CACHE_PATH, 'benchmark')
+    campaign = {'num_clocks': 24, 'num_sizes': 32, 'num_meas': 1024}
+    repeat = 3
+    results_path = os.path.join(root, 'results.json')
+    baseline_path = os.path.join(root, 'baseline.json')
+    if_save_baseline = False
+    tolerance = 0.1
+    #config end
+    if generate_campaign(root, **campaign):
+        print(f'generated synthetic campaign in {root}')
+    suite_path = os.path.join(root, 'suite.json')
+    # the modules read the data folders from the setup paths at import
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--suite',
+                    suite_path, str(repeat)],
+                   env={**os.environ, 'IPC_VISU_ROOT': root}, check=True)
+    with open(suite_path, 'r') as file:
+        timings = json.load(file)
+    results = {'campaign': campaign, 'timings': timings,
+               'python': platform.python_version(),
+               'numpy': np.__version__, 'machine': platform.machine(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(results_path, 'w') as file:
+        json.dump(results, file, indent=4)
+    if if_save_baseline:
+        with open(baseline_path, 'w') as file:
+            json.dump(results, file, indent=4)
+        print(f'baseline saved to {baseline_path}')
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, 'r') as file:
+            regressed = compare(results, json.load(file), tolerance)
+        if regressed:
+            sys.exit(f'regressed: {", ".join(regressed)}')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--suite']:
+        timings = run_suite(repeat=int(sys.argv[3]))
+        with open(sys.argv[2], 'w') as file:
+            json.dump(timings, file, indent=4)
+    else:
+        main()
@@ -0,0 +1,257 @@
+import os
+import zlib
+import regex
+import struct
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from setup_paths import *
+
+# compact measurement files, they keep the .log name and are told apart
+# from the text files by the magic
+LOG_MAGIC = b'IPCL'
+LOG_VERSION = 1
+ENCODING_DELTA_VARINT = 0 # zigzag deltas of the samples as LEB128 varints
+# magic, version, encoding, direction, pad, m7, m4, timer clock [MHz],
+# size [byte], count, payload length [byte], crc32 of the info and payload,
+# length of the header info text [byte], the info text follows the header
+LOG_HEADER = struct.Struct('<4sBBcxHHHIIIIH')
+MAX_VARINT_BYTES = 10 # 64 bit values
+
+class BinLogError(ValueError):
+    '''Error raised for compact files that can not be decoded'''
+    def __init__(self, field, expected, actual) -> None:
+        super().__init__(f'wrong {field}, expected {expected}, got {actual}')
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+
+class LogHeader():
+    '''Structured header of a compact measurement file'''
+    def __init__(self, direction, m7, m4, timer_clock, sent_data_size,
+                 count, header_info='', payload_len=0, crc=0):
+        '''
+        Args:
+            direction: 'r' or 's'
+            m7, m4: core clocks [MHz], 0 if unknown
+            timer_clock: timer clock frequency [MHz]
+            sent_data_size: number of bytes sent
+            count: number of samples
+            header_info: text of the header line after the timer clock,
+                e.g. the precision of an adaptive measurement'''
+        self.direction = direction
+        self.m7 = m7
+        self.m4 = m4
+        self.timer_clock = timer_clock
+        self.sent_data_size = sent_data_size
+        self.count = count
+        self.header_info = header_info
+        self.payload_len = payload_len
+        self.crc = crc
+
+    def pack(self):
+        '''Returns the header bytes with the info text'''
+        info = self.header_info.encode('utf-8')
+        return LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, ENCODING_DELTA_VARINT,
+                               self.direction.encode('ascii'), self.m7,
+                               self.m4, self.timer_clock, self.sent_data_size,
+                               self.count, self.payload_len, self.crc,
+                               len(info)) + info
+
+    @classmethod
+    def unpack(cls, data):
+        '''Reads the header and the info text from the start of data
+        Raises: BinLogError for an unknown version or encoding, or if data
+            ends in the header'''
+        size = header_size(data)
+        if len(data) < size:
+            raise BinLogError('header', f'{size} bytes', f'{len(data)} bytes')
+        (_, _, encoding, direction, m7, m4, timer_clock, sent_data_size,
+         count, payload_len, crc, _) = LOG_HEADER.unpack_from(data)
+        if encoding != ENCODING_DELTA_VARINT:
+            raise BinLogError('encoding', ENCODING_DELTA_VARINT, encoding)
+        info = bytes(data[LOG_HEADER.size:size]).decode('utf-8')
+        return cls(direction.decode('ascii'), m7, m4, timer_clock,
+                   sent_data_size, count, info, payload_len, crc)
+
+def header_size(data):
+    '''Returns the length of the header with the info text from its fixed
+        part at the start of data
+    Raises: BinLogError if data is not a compact file of a known version'''
+    if len(data) < LOG_HEADER.size:
+        raise BinLogError('header', f'{LOG_HEADER.size} bytes',
+                          f'{len(data)} bytes')
+    magic, version = LOG_HEADER.unpack_from(data)[:2]
+    if magic != LOG_MAGIC:
+        raise BinLogError('magic', LOG_MAGIC, magic)
+    if version != LOG_VERSION:
+        raise BinLogError('version', LOG_VERSION, version)
+    return LOG_HEADER.size + LOG_HEADER.unpack_from(data)[-1]
+
+def is_binlog(data):
+    '''Returns if the bytes are the start of a compact file'''
+    return bytes(data[:len(LOG_MAGIC)]) == LOG_MAGIC
+
+def encode_samples(samples):
+    '''Encodes the samples as zigzag deltas in varints, the samples close
+        to the previous one take one byte
+    Returns: bytes of the payload'''
+    values = np.asarray(samples, dtype=np.int64)
+    deltas = np.diff(values, prepend=0)
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+    num_bytes = np.ones(len(zigzag), dtype=np.int64)
+    for shift in range(7, 7 * MAX_VARINT_BYTES, 7):
+        num_bytes += zigzag >= (np.uint64(1) << np.uint64(shift))
+    starts = np.cumsum(num_bytes) - num_bytes
+    out = np.empty(int(num_bytes.sum()), dtype=np.uint8)
+    # byte k of every value at once, 7 bits and the continuation bit
+    for k in range(int(num_bytes.max(initial=0))):
+        has_byte = num_bytes > k
+        low_bits = (zigzag[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        continuation = np.where(num_bytes[has_byte] > k + 1, 0x80, 0)
+        out[starts[has_byte] + k] = low_bits.astype(np.uint8) | continuation
+    return out.tobytes()
+
+def decode_samples(payload, count, out=None):
+    '''Decodes count samples from the payload of encode_samples
+    Args:
+        out: optional np.uint32 buffer of length count
+    Returns: np.array of the samples
+    Raises: BinLogError if the payload does not hold count uint32 samples'''
+    raw = np.frombuffer(payload, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if len(ends) != count or (len(raw) and raw[-1] >= 0x80):
+        raise BinLogError('sample count', count, len(ends))
+    starts = np.concatenate(([0], ends[:-1] + 1)) if count else ends
+    lengths = ends - starts + 1
+    if len(lengths) and lengths.max() > MAX_VARINT_BYTES:
+        raise BinLogError('varint', f'at most {MAX_VARINT_BYTES} bytes',
+                          f'{lengths.max()} bytes')
+    zigzag = np.zeros(count, dtype=np.uint64)
+    for k in range(int(lengths.max(initial=0))):
+        has_byte = lengths > k
+        low_bits = (raw[starts[has_byte] + k] & 0x7f).astype(np.uint64)
+        zigzag[has_byte] |= low_bits << np.uint64(7 * k)
+    deltas = (zigzag >> np.uint64(1)).view(np.int64) \
+        ^ -(zigzag & np.uint64(1)).view(np.int64)
+    values = np.cumsum(deltas)
+    if count and (values.min() < 0 or values.max() > np.iinfo(np.uint32).max):
+        raise BinLogError('value', 'uint32', f'{values.min()}..{values.max()}')
+    if out is None:
+        return values.astype(np.uint32)
+    out[:] = values
+    return out
+
+def read_payload(data):
+    '''Returns the header and the checked payload of a compact file
+    Raises: BinLogError if the file is truncated or corrupted'''
+    header = LogHeader.unpack(data)
+    size = header_size(data)
+    payload = memoryview(data)[size:]
+    if len(payload) != header.payload_len:
+        raise BinLogError('payload length', header.payload_len, len(payload))
+    # the info text is checked too
+    checked = memoryview(data)[LOG_HEADER.size:]
+    if zlib.crc32(checked) != header.crc:
+        raise BinLogError('crc', f'{header.crc:#010x}',
+                          f'{zlib.crc32(checked):#010x}')
+    return header, payload
+
+def to_bytes(header, samples):
+    '''Returns the whole compact file of the samples, the payload length
+        and crc of the header are filled in'''
+    payload = encode_samples(samples)
+    header.count = len(samples)
+    header.payload_len = len(payload)
+    header.crc = zlib.crc32(header.header_info.encode('utf-8') + payload)
+    return header.pack() + payload
+
+def write_file(filename, header, samples):
+    '''Writes a compact file through a temporary file'''
+    tmp_path = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(to_bytes(header, samples))
+    os.replace(tmp_path, filename)
+
+_clock_dir_pattern = regex.compile(r'meas_[rs]_([0-9]+)_([0-9]+)')
+_timer_clock_pattern = regex.compile(rb'timer clock:\s*([0-9]+) MHz(.*)')
+
+def clocks_from_dir(dir_prefix):
+    '''Returns (m7, m4) from the name of the clock folder, (0, 0) if the
+        name does not hold them'''
+    match = _clock_dir_pattern.fullmatch(os.path.basename(
+        os.path.normpath(dir_prefix)))
+    return (int(match[1]), int(match[2])) if match else (0, 0)
+
+def convert_file(filename):
+    '''Converts a text measurement file to the compact format in place,
+        files already compact are left as they are
+    Returns: (size before, size after) [byte]'''
+    import measurement
+    with open(filename, 'rb') as file:
+        data = file.read()
+    if is_binlog(data):
+        return len(data), len(data)
+    count, sent_data_size = measurement.read_meas_header(filename)
+    samples = measurement.parse_meas_file(filename, sent_data_size)
+    m7, m4 = clocks_from_dir(os.path.dirname(os.path.abspath(filename)))
+    lines, _ = measurement._split_header(data, measurement.HEADER_LINES)
+    match = _timer_clock_pattern.search(lines[0])
+    timer_clock = int(match[1]) if match else m4
+    header_info = match[2].decode('utf-8') if match else ''
+    # binary acquisition echoes the direction in upper case
+    direction = lines[1].decode('ascii').lower()
+    if direction not in ('r', 's'):
+        raise BinLogError('direction', "'r' or 's'", direction)
+    content = to_bytes(LogHeader(direction, m7, m4, timer_clock,
+                                 sent_data_size, count, header_info), samples)
+    # decoded again before the text file is replaced
+    header, payload = read_payload(content)
+    if not np.array_equal(decode_samples(payload, header.count), samples):
+        raise BinLogError('round trip', 'same samples', 'different samples')
+    tmp_path = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, filename)
+    return len(data), len(content)
+
+def _convert_or_error(filename):
+    '''Converts one file in a worker, the error message is returned to the
+        caller so the other files are still converted, the exceptions with
+        extra fields can not be pickled back'''
+    try:
+        return convert_file(filename), None
+    except Exception as error:
+        return None, repr(error)
+
+def convert_tree(root_path=MEASUREMENTS_PATH, workers=None):
+    '''Converts every meas<size>.log under the folder to the compact format,
+        a file that can not be converted is left as it is
+    Args:
+        workers: number of processes, None for the number of processors
+    Returns: (number of converted files, total size before, total size
+        after, dict of the failed filenames to their error messages)'''
+    filenames = [os.path.join(dir_path, name)
+                 for dir_path, _, names in os.walk(root_path)
+                 for name in names
+                 if regex.fullmatch(r'meas[0-9]+\.log', name)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_convert_or_error, filenames,
+                                    chunksize=64))
+    sizes = [size for size, _ in results if size is not None]
+    errors = {filename: error for filename, (_, error)
+              in zip(filenames, results) if error is not None}
+    before = sum(size[0] for size in sizes)
+    after = sum(size[1] for size in sizes)
+    return len(sizes), before, after, errors
+
+def main():
+    '''Converting the measurement tree to the compact format'''
+    num_files, before, after, errors = convert_tree(MEASUREMENTS_PATH)
+    print(f'{num_files} files, {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB')
+    for filename, error in errors.items():
+        print(f'{filename} not converted: {error}')
+
+if __name__ == '__main__':
+    main()
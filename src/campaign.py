@@ -0,0 +1,218 @@
+import os
+import json
+import asyncio
+import serial
+
+from concurrent.futures import ThreadPoolExecutor
+
+from setup_paths import *
+import measurement
+
+def point_dir(measurements_path, mem, direction, m7, m4):
+    '''Returns the folder of the measurement files of a point'''
+    return os.path.join(measurements_path, mem, f'meas_{direction}_{m7}_{m4}')
+
+PLANNED, DONE, FAILED = 'planned', 'done', 'failed'
+
+class CampaignManifest():
+    '''Every planned point of a campaign with its status, saved as json
+        after each change'''
+    def __init__(self, path, num_meas, statuses):
+        '''Use create or load instead
+        Args:
+            statuses: dict of (mem, direction, (m7, m4), size) to status'''
+        self.path = path
+        self.num_meas = num_meas
+        self.statuses = statuses
+
+    @classmethod
+    def create(cls, path, work, num_meas):
+        '''Creates and saves the manifest with every point planned'''
+        manifest = cls(path, num_meas, {point: PLANNED for point in work})
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a saved manifest'''
+        with open(path, 'r') as file:
+            content = json.load(file)
+        statuses = {(point['mem'], point['direction'],
+                     (point['m7'], point['m4']), point['size']): point['status']
+                    for point in content['points']}
+        return cls(path, content['num_meas'], statuses)
+
+    def save(self):
+        '''Writes the manifest to a temporary file and renames it'''
+        points = [{'mem': mem, 'direction': direction, 'm7': m7, 'm4': m4,
+                   'size': size, 'status': status}
+                  for (mem, direction, (m7, m4), size), status
+                  in self.statuses.items()]
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'num_meas': self.num_meas, 'points': points}, file,
+                      indent=4)
+        os.replace(tmp_path, self.path)
+
+    def mark(self, point, status):
+        '''Sets the status of the point and saves the manifest'''
+        self.statuses[point] = status
+        self.save()
+
+    def pending(self, measurements_path=MEASUREMENTS_PATH):
+        '''Returns the points still to be measured, done points are checked
+            and measured again if their file is missing or invalid'''
+        points = []
+        for point, status in self.statuses.items():
+            mem, direction, (m7, m4), size = point
+            if status == DONE and measurement.is_meas_complete(
+                    point_dir(measurements_path, mem, direction, m7, m4),
+                    size, self.num_meas):
+                continue
+            points.append(point)
+        return points
+
+async def _port_worker(serial_config, work_queue, result_queue, failed,
+                       num_meas, timeout, if_binary, max_retries,
+                       max_port_failures):
+    '''Measures points from the work queue on one port until it is empty
+        or the port failed too many times in a row'''
+    loop = asyncio.get_running_loop()
+    # one thread per port, the serial calls of a port never overlap
+    executor = ThreadPoolExecutor(max_workers=1)
+    session = None
+    port_failures = 0
+    try:
+        while port_failures < max_port_failures:
+            try:
+                point, retries = work_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            mem, direction, (m7, m4), size = point
+            try:
+                if session is None:
+                    session = await loop.run_in_executor(
+                        executor, measurement.MeasSession, serial_config,
+                        if_binary)
+                response = await asyncio.wait_for(loop.run_in_executor(
+                    executor, session.measure, num_meas, size, direction),
+                    timeout)
+            except (asyncio.TimeoutError, serial.SerialException,
+                    measurement.FrameError) as error:
+                print(f'{serial_config.port}: {point} failed: {error!r}')
+                if session is not None:
+                    session.close() # also unblocks the pending read
+                    session = None
+                port_failures += 1
+                if retries < max_retries:
+                    work_queue.put_nowait((point, retries + 1))
+                else:
+                    failed.append(point)
+                continue
+            port_failures = 0
+            # waits if the writer falls behind
+            await result_queue.put((point, response))
+    finally:
+        if session is not None:
+            session.close()
+        executor.shutdown(wait=False)
+
+async def _writer(result_queue, failed, num_meas, measurements_path,
+                  manifest):
+    '''Writes the results to file until None is received, a point that can
+        not be written is added to failed, the writer keeps consuming so
+        the ports never wait on a full queue'''
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await result_queue.get()
+        if item is None:
+            return
+        point, response = item
+        mem, direction, (m7, m4), size = point
+        try:
+            dir_prefix = point_dir(measurements_path, mem, direction, m7, m4)
+            os.makedirs(dir_prefix, exist_ok=True)
+            # timer clock is always the same as the m4 core's clock
+            await loop.run_in_executor(
+                None, measurement.write_meas_to_file, dir_prefix, response,
+                size, num_meas, m4, direction)
+            if manifest is not None:
+                manifest.mark(point, DONE)
+        except Exception as error:
+            print(f'{point} could not be written: {error!r}')
+            failed.append(point)
+
+async def run_campaign(work, serial_configs, num_meas=1024,
+                       measurements_path=MEASUREMENTS_PATH, timeout=120,
+                       if_binary=False, max_retries=1, max_port_failures=3,
+                       queue_size=4, manifest=None):
+    '''Measures the work list on several boards in parallel
+    Args:
+        work: list of (mem, direction, (m7, m4), size) points, the boards
+            have to run with the clocks of the points
+        serial_configs: list of SerialConfig, one for each board
+        num_meas: repetition count of each point
+        timeout: time limit of one point in seconds
+        max_retries: number of times a failed point is queued again
+        max_port_failures: a port is dropped after this many failures in a row
+        queue_size: number of results waiting for the writer before the
+            ports are paused
+        manifest: optional CampaignManifest updated with the status of
+            each point
+    Returns: list of the points that could not be measured'''
+    work_queue = asyncio.Queue()
+    for point in work:
+        work_queue.put_nowait((point, 0))
+    result_queue = asyncio.Queue(maxsize=queue_size)
+    failed = []
+    writer = asyncio.create_task(_writer(result_queue, failed, num_meas,
+                                         measurements_path, manifest))
+    await asyncio.gather(*(_port_worker(
+        serial_config, work_queue, result_queue, failed, num_meas, timeout,
+        if_binary, max_retries, max_port_failures)
+        for serial_config in serial_configs))
+    await result_queue.put(None)
+    await writer
+    # points left over when every port was dropped
+    while not work_queue.empty():
+        failed.append(work_queue.get_nowait()[0])
+    if manifest is not None:
+        for point in failed:
+            manifest.mark(point, FAILED)
+    return failed
+
+async def resume_campaign(manifest_path, serial_configs,
+                          measurements_path=MEASUREMENTS_PATH, **kwargs):
+    '''Measures the points of a saved manifest that are not complete yet,
+        kwargs are passed to run_campaign
+    Returns: list of the points that could not be measured'''
+    manifest = CampaignManifest.load(manifest_path)
+    work = manifest.pending(measurements_path)
+    print(f'{len(manifest.statuses) - len(work)} points already done, '
+          f'{len(work)} to measure')
+    return await run_campaign(work, serial_configs, num_meas=manifest.num_meas,
+                              measurements_path=measurements_path,
+                              manifest=manifest, **kwargs)
+
+def main():
+    '''Measuring the work list on all connected boards'''
+    #config begin
+    ports = ['COM5', 'COM6']
+    memory = 'D3_tmp'
+    sizes = [1, 256, 4096, 16380]
+    meas_directions = ['r', 's']
+    clocks = [(120, 120)]
+    num_meas = 1024
+    manifest_path = os.path.join(MEASUREMENTS_PATH, 'manifest.json')
+    #config end
+    serial_configs = [measurement.SerialConfig(port, 115200, 8, 'N', 1)
+                      for port in ports]
+    work = [(memory, direction, clock, size) for clock in clocks
+            for direction in meas_directions for size in sizes]
+    if not os.path.exists(manifest_path):
+        CampaignManifest.create(manifest_path, work, num_meas)
+    failed = asyncio.run(resume_campaign(manifest_path, serial_configs))
+    print(f'failed points: {failed}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import os
+import json
+import atexit
+
+from setup_paths import *
+
+CATALOG_FILE = os.path.join(CACHE_PATH, 'catalog.json')
+
+class Catalog():
+    '''Listings of the measurement folders, kept in memory and on disk, a
+        listing is only read again if the mtime of its folder changed'''
+    def __init__(self, catalog_file=CATALOG_FILE):
+        self.catalog_file = catalog_file
+        self.if_dirty = False
+        try:
+            with open(catalog_file, 'r') as file:
+                self.listings = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.listings = {}
+
+    def _read(self, path, mtime):
+        '''Lists the folder with one scandir call'''
+        dirs, files = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                (dirs if entry.is_dir() else files).append(entry.name)
+        listing = {'mtime': mtime, 'dirs': dirs, 'files': files}
+        self.listings[path] = listing
+        self.if_dirty = True
+        return listing
+
+    def listing(self, folder_path):
+        '''Returns the listing of the folder, one stat call if it is known'''
+        path = os.path.abspath(folder_path)
+        mtime = os.stat(path).st_mtime_ns
+        listing = self.listings.get(path)
+        if listing is None or listing['mtime'] != mtime:
+            listing = self._read(path, mtime)
+        return listing
+
+    def get_dirs(self, folder_path):
+        '''Returns the names of the folders in the folder'''
+        return self.listing(folder_path)['dirs']
+
+    def get_files(self, folder_path):
+        '''Returns the names of the files in the folder'''
+        return self.listing(folder_path)['files']
+
+    def scan(self, root_path=MEASUREMENTS_PATH):
+        '''Walks the tree once, updating the changed listings'''
+        stack = [root_path]
+        while stack:
+            path = stack.pop()
+            listing = self.listing(path)
+            stack.extend(os.path.join(path, name) for name in listing['dirs'])
+
+    def save(self):
+        '''Writes the catalog if it changed'''
+        if not self.if_dirty:
+            return
+        os.makedirs(os.path.dirname(self.catalog_file), exist_ok=True)
+        tmp_path = f'{self.catalog_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.listings, file)
+        os.replace(tmp_path, self.catalog_file)
+        self.if_dirty = False
+
+_default_catalog = None
+
+def default_catalog():
+    '''Catalog shared by the module functions, saved at exit'''
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = Catalog()
+        atexit.register(_default_catalog.save)
+    return _default_catalog
+
+if __name__ == '__main__':
+    catalog = default_catalog()
+    catalog.scan()
+    print(f'{len(catalog.listings)} folders in the catalog')
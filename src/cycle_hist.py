@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+import measurement
+import meas_cache
+
+DENSE_RANGE = 1 << 20 # wider sample ranges are counted sparsely
+HIST_SUFFIX = '.hist.npz'
+
+class CycleHistogram():
+    '''Exact histogram of integer clk samples, stored sparsely as the
+        sorted distinct values and their counts'''
+    def __init__(self, values=None, counts=None):
+        self.values = np.zeros(0, dtype=np.int64) if values is None \
+            else np.asarray(values, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None \
+            else np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_samples(cls, samples):
+        '''Counts the samples, with bincount if their range is narrow'''
+        samples = np.asarray(samples, dtype=np.int64).ravel()
+        if samples.size == 0:
+            return cls()
+        low, high = samples.min(), samples.max()
+        if high - low < DENSE_RANGE:
+            dense = np.bincount(samples - low)
+            values = np.flatnonzero(dense)
+            return cls(values + low, dense[values])
+        values, counts = np.unique(samples, return_counts=True)
+        return cls(values, counts)
+
+    def merge(self, other):
+        '''Returns the histogram of the samples of both histograms, e.g. of
+            repeated runs of the same point'''
+        values = np.concatenate((self.values, other.values))
+        counts = np.concatenate((self.counts, other.counts))
+        merged, inverse = np.unique(values, return_inverse=True)
+        merged_counts = np.zeros(len(merged), dtype=np.int64)
+        np.add.at(merged_counts, inverse.ravel(), counts)
+        return CycleHistogram(merged, merged_counts)
+
+    def between(self, low, high):
+        '''Returns the histogram of the samples with low < sample < high'''
+        keep = (low < self.values) & (self.values < high)
+        return CycleHistogram(self.values[keep], self.counts[keep])
+
+    @property
+    def count(self):
+        '''Number of samples'''
+        return int(np.sum(self.counts))
+
+    @property
+    def mean(self):
+        '''Mean of the samples'''
+        return float(np.sum(self.values * self.counts) / self.count)
+
+    @property
+    def std(self):
+        '''Population std of the samples like np.std'''
+        deviation = self.values - self.mean
+        return float(np.sqrt(np.sum(deviation**2 * self.counts) / self.count))
+
+    @property
+    def min(self):
+        '''Smallest sample'''
+        return int(self.values[0])
+
+    @property
+    def max(self):
+        '''Largest sample'''
+        return int(self.values[-1])
+
+    def quantile(self, q):
+        '''Smallest sample with at least q of the samples at or below it'''
+        cumulative = np.cumsum(self.counts)
+        idx = np.searchsorted(cumulative, np.asarray(q) * self.count)
+        return self.values[np.minimum(idx, len(self.values) - 1)]
+
+    def save(self, path, source_stat=None):
+        '''Writes the histogram, source_stat of the log is stored to detect
+            changes of the log'''
+        size, mtime = (source_stat.st_size, source_stat.st_mtime_ns) \
+            if source_stat else (-1, -1)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, values=self.values, counts=self.counts,
+                     source=np.array((size, mtime), dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source_stat=None):
+        '''Reads a histogram written by save, None if the stored source stat
+            does not match source_stat'''
+        with np.load(path) as content:
+            if source_stat is not None and tuple(content['source']) != \
+                    (source_stat.st_size, source_stat.st_mtime_ns):
+                return None
+            return cls(content['values'], content['counts'])
+
+def hist_path(filename):
+    '''Path of the histogram stored next to the measurement log'''
+    return os.path.splitext(filename)[0] + HIST_SUFFIX
+
+def read_hist(filename, buffer_len):
+    '''Returns the histogram of a measurement log, stored next to the log
+        and computed again only if the log changed'''
+    path = hist_path(filename)
+    source_stat = os.stat(filename)
+    try:
+        hist = CycleHistogram.load(path, source_stat)
+        if hist is not None:
+            return hist
+    except (OSError, ValueError, KeyError): # missing or unreadable
+        pass
+    hist = CycleHistogram.from_samples(meas_cache.load_or_parse(
+        filename, lambda name: measurement.parse_meas_file(name, buffer_len)))
+    hist.save(path, source_stat)
+    return hist
+
+def read_hists(sizes, dir_prefix):
+    '''Returns the histograms of the measurement files for the sizes'''
+    return [read_hist(os.path.join(dir_prefix, f'meas{size}.log'), size)
+            for size in sizes]
+
+def merge_files(filenames, buffer_len):
+    '''Merged histogram of repeated measurement logs of the same point'''
+    merged = CycleHistogram()
+    for filename in filenames:
+        merged = merged.merge(read_hist(filename, buffer_len))
+    return merged
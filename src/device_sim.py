@@ -0,0 +1,168 @@
+import os
+import tty
+import time
+import zlib
+import select
+import threading
+import numpy as np
+
+from setup_paths import *
+import measurement
+import linear_model
+
+class SimulatedDevice():
+    '''Simulated board speaking the measurement protocol over a pty, the
+        latencies come from the linear model with noise, outliers and
+        warm-up, the output is throttled to the baud rate'''
+    def __init__(self, model, mem, m7, m4, noise_std=2.0, outlier_prob=1e-3,
+                 outlier_scale=200.0, warmup_samples=4, warmup_factor=1.5,
+                 baud=115200, seed=None):
+        '''Opens the pty, the port name of the device is in self.port
+        Args:
+            model: LinearModel with the parameters of mem
+            m7, m4: simulated core clocks [MHz], the timer runs on m4
+            noise_std: std of the gaussian noise [clk]
+            outlier_prob: probability of a sample being an outlier
+            outlier_scale: mean of the exponential outlier delay [clk]
+            warmup_samples: number of samples at the start slowed down
+            warmup_factor: slowdown of the warm-up samples
+            baud: simulated baud rate, None for no throttling'''
+        self.model = model
+        self.mem = mem
+        self.m7 = m7
+        self.m4 = m4
+        self.noise_std = noise_std
+        self.outlier_prob = outlier_prob
+        self.outlier_scale = outlier_scale
+        self.warmup_samples = warmup_samples
+        self.warmup_factor = warmup_factor
+        self.baud = baud
+        self.rng = np.random.default_rng(seed)
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.running = False
+        self.thread = None
+
+    def latencies(self, direction, num_meas, sent_data_size):
+        '''Generates the measured latencies in timer clks'''
+        self.model.set_model(self.mem, direction)
+        latency = float(self.model.get_latency(self.m7, self.m4,
+                                               sent_data_size)) # us
+        samples = self.rng.normal(latency * self.m4, self.noise_std, num_meas)
+        samples[:self.warmup_samples] *= self.warmup_factor
+        outliers = self.rng.random(num_meas) < self.outlier_prob
+        samples[outliers] += self.rng.exponential(self.outlier_scale,
+                                                  np.count_nonzero(outliers))
+        return np.maximum(np.rint(samples), 1).astype(measurement.SAMPLE_DTYPE)
+
+    def _read_byte(self):
+        '''Reads one byte from the host, None if the device was stopped'''
+        while self.running:
+            readable, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if readable:
+                return os.read(self.master_fd, 1)
+        return None
+
+    def _read_number(self):
+        '''Reads a number terminated by \\r'''
+        digits = b''
+        while (byte := self._read_byte()) not in (b'\r', None):
+            digits += byte
+        return None if byte is None else int(digits)
+
+    def _write(self, data):
+        '''Writes to the host with the speed of the simulated baud rate'''
+        chunk_len = max(1, self.baud // 100) if self.baud else len(data)
+        start = time.perf_counter()
+        for begin in range(0, len(data), chunk_len):
+            os.write(self.master_fd, data[begin:begin + chunk_len])
+            if self.baud:
+                # 10 bits for each byte with start and stop bit
+                sent_time = (begin + chunk_len) * 10 / self.baud
+                delay = start + sent_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def serve(self):
+        '''Answers measurement requests until stopped'''
+        while self.running:
+            start_char = self._read_byte()
+            if start_char == b'a': # connection test of connection.py
+                self._write(b'a')
+                continue
+            if start_char is None or start_char not in b'rsRS':
+                continue
+            self._write(start_char + b'\r\n')
+            num_meas = self._read_number()
+            if num_meas is None:
+                return
+            self._write(f'{num_meas}\r\r\n'.encode('ascii'))
+            sent_data_size = self._read_number()
+            if sent_data_size is None:
+                return
+            self._write(f'{sent_data_size}\r\r\n'.encode('ascii'))
+
+            samples = self.latencies(start_char.decode('ascii').lower(),
+                                     num_meas, sent_data_size)
+            if start_char.isupper(): # binary frame
+                payload = samples.tobytes()
+                self._write(measurement.FRAME_HEADER.pack(
+                                measurement.FRAME_MAGIC, len(payload))
+                            + payload
+                            + measurement.FRAME_CRC.pack(zlib.crc32(payload)))
+            else:
+                self._write(b''.join(measurement.samples_to_lines(samples)))
+
+    def start(self):
+        '''Starts serving on a background thread'''
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''Stops serving and closes the pty'''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    '''Measuring acquisition throughput against the simulated device'''
+    #config begin
+    model_path = os.path.join(MODELS_PATH, 'models_long.json')
+    mem = 'D1'
+    m7, m4 = 240, 120
+    baud = 115200
+    num_meas = 1024
+    sizes = [1, 256, 4096, 16380]
+    #config end
+    model = linear_model.LinearModel(model_path, mem, 's')
+    with SimulatedDevice(model, mem, m7, m4, baud=baud) as device:
+        serial_config = measurement.SerialConfig(device.port, baud, 8, 'N', 1)
+        points = [(direction, size) for direction in ['r', 's'] for size in sizes]
+        for if_binary in [False, True]:
+            start = time.perf_counter()
+            for direction, size in points:
+                measurement.measure(num_meas, size, serial_config, direction,
+                                    if_binary=if_binary)
+            single = time.perf_counter() - start
+            start = time.perf_counter()
+            with measurement.MeasSession(serial_config, if_binary) as session:
+                for _ in session.sweep(points, num_meas, if_pipeline=True):
+                    pass
+            sweep = time.perf_counter() - start
+            mode = 'binary' if if_binary else 'ascii'
+            print(f'{mode}: {single:.2f} s one by one, {sweep:.2f} s sweep '
+                  f'for {len(points)} points')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import json
+import hashlib
+import inspect
+import matplotlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+from setup_paths import *
+import tracing
+
+STAMPS_FILE = '.figure_stamps.json'
+# files derived from the inputs while rendering, e.g. stored histograms
+IGNORED_SUFFIXES = ('.hist.npz', '.tmp')
+
+class FigureTarget():
+    '''Figure file built by a render function from tracked inputs'''
+    def __init__(self, filename, render, inputs, params=None):
+        '''
+        Args:
+            filename: name of the figure in the figures folder
+            render: module level function drawing a new figure from params
+            inputs: function returning the input files and folders, folders
+                are tracked with every file in them
+            params: dict of keyword arguments of render, json serializable'''
+        self.filename = filename
+        self.render = render
+        self.inputs = inputs
+        self.params = params or {}
+
+def _input_files(paths):
+    '''Returns the sorted files of the paths, folders are walked'''
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, filenames in os.walk(path):
+                files.update(os.path.join(dir_path, name) for name in filenames
+                             if not name.endswith(IGNORED_SUFFIXES))
+        else: # missing files are tracked as missing
+            files.add(path)
+    return sorted(os.path.abspath(file) for file in files)
+
+def _file_hash(path, file_stamps):
+    '''Content hash of the file, only rehashed if the size or mtime changed'''
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 'missing'
+    stamp = file_stamps.get(path)
+    if stamp and stamp[0] == stat.st_size and stamp[1] == stat.st_mtime_ns:
+        return stamp[2]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    file_stamps[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+    return sha.hexdigest()
+
+def target_digest(target, file_stamps):
+    '''Hash of the params, the render function and the input contents'''
+    sha = hashlib.sha1()
+    # the file of the module, the module name is __main__ in a script
+    render_file = os.path.abspath(inspect.getfile(target.render))
+    sha.update(f'{render_file}:{target.render.__qualname__}'.encode())
+    sha.update(json.dumps(target.params, sort_keys=True).encode())
+    for path in _input_files(target.inputs()):
+        sha.update(path.encode())
+        sha.update(_file_hash(path, file_stamps).encode())
+    return sha.hexdigest()
+
+def _init_worker():
+    '''Headless backend for the worker processes'''
+    matplotlib.use('Agg')
+
+def _render(render, params, out):
+    '''Renders and saves one figure in a worker process'''
+    import matplotlib.pyplot as plt
+    plt.close('all')
+    with tracing.span(os.path.basename(out)):
+        render(**params)
+        with tracing.span('savefig'):
+            plt.savefig(out)
+    plt.close('all')
+    tracing.count('figures rendered')
+    tracing.flush()
+    return out
+
+def build(targets, out_dir=FIGURES_PATH, workers=None, if_force=False):
+    '''Renders the figures whose inputs changed since their last build,
+        independent figures are rendered in parallel processes
+    Args:
+        targets: list of FigureTarget
+        workers: number of processes, None for the number of processors
+        if_force: if every figure should be rendered
+    Returns: list of the rendered filenames'''
+    stamps_path = os.path.join(out_dir, STAMPS_FILE)
+    try:
+        with open(stamps_path, 'r') as file:
+            stamps = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        stamps = {'files': {}, 'targets': {}}
+
+    stale = {}
+    for target in targets:
+        digest = target_digest(target, stamps['files'])
+        out = os.path.join(out_dir, target.filename)
+        if if_force or not os.path.exists(out) \
+                or stamps['targets'].get(target.filename) != digest:
+            stale[target.filename] = (target, digest)
+
+    rendered = []
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker) as executor:
+            futures = {filename: executor.submit(
+                           _render, target.render, target.params,
+                           os.path.join(out_dir, filename))
+                       for filename, (target, _) in stale.items()}
+            for filename, future in futures.items():
+                try:
+                    future.result()
+                except Exception as error: # the other figures are still saved
+                    print(f'{filename} failed: {error!r}')
+                    continue
+                stamps['targets'][filename] = stale[filename][1]
+                rendered.append(filename)
+                print(f'rendered {filename}')
+    with open(stamps_path + '.tmp', 'w') as file:
+        json.dump(stamps, file)
+    os.replace(stamps_path + '.tmp', stamps_path)
+    return rendered
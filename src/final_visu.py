@@ -3,12 +3,22 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from setup_paths import *
-import measurement
 import linear_model
 import visu_common
 import histogram
+import cycle_hist
 import visu_3d
 import visu
+import figure_build
+
+MODEL_PATH = os.path.join(MODELS_PATH, 'models_long.json')
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+# modules drawing the figures and reading their data, a change in them
+# rebuilds every figure
+CODE_INPUTS = [os.path.join(SRC_PATH, f'{module}.py') for module in
+               ['final_visu', 'measurement', 'linear_model', 'visu_common',
+                'histogram', 'cycle_hist', 'visu_3d', 'visu', 'meas_cache',
+                'binlog', 'catalog', 'online_stats', 'tracing']]
 
 def if_large_size(size):
     '''Fuction to return sizes for the long size plots'''
@@ -18,41 +28,63 @@ def if_small_size(size):
     '''Function to return sizes for the short size plots'''
     return size <= 256
 
-def main():
-    '''Printing and writing out all final plots'''
-    model_path = os.path.join(MODELS_PATH, 'models_long.json')
-    mem_regex = r'D[0-9](_idcache_mpu_ncacheable)?'
-    linear_model.print_table(model_path, mem_regex)    
-    # =====================================================================
-    # Histogram
-    filename = 'histogram.pdf'
-    mem = 'D3_idcache_mpu_ncacheable_release' #visu_common.get_mems('pilot', pattern=r'D3_.*')
-    dir_prefix = os.path.join(PILOT_PATH, mem)
-    m7, m4 = 480, 240
+def config_inputs(configs):
+    '''Returns the input folders of size plots for the configs'''
+    def inputs():
+        return CODE_INPUTS + [MODEL_PATH] + [
+            os.path.join(MEASUREMENTS_PATH, config['mem'],
+                         f'meas_{direction}_{config["clk"][0]}_{config["clk"][1]}')
+            for config in configs for direction in ['r', 's']]
+    return inputs
+
+def mem_inputs(mem_regex):
+    '''Returns the input folders of 3d plots for the matching mems'''
+    def inputs():
+        return CODE_INPUTS + [MODEL_PATH] + [
+            os.path.join(MEASUREMENTS_PATH, mem)
+            for mem in visu_common.get_mems(MEASUREMENTS_PATH, mem_regex)]
+    return inputs
+
+# =====================================================================
+# Histogram
+HISTOGRAM_MEM = 'D3_idcache_mpu_ncacheable_release' #visu_common.get_mems('pilot', pattern=r'D3_.*')
+HISTOGRAM_CLK = (480, 240)
+
+def histogram_figure():
+    '''Histograms of the pilot measurements'''
+    dir_prefix = os.path.join(PILOT_PATH, HISTOGRAM_MEM)
+    m7, m4 = HISTOGRAM_CLK
     plt.figure(figsize=(10, 9.5), layout='tight')
     i = 0
     for direction in ['r', 's']:
         for sizes in [[256], [16380]]:
             measurement_folder = os.path.join(dir_prefix, f'meas_{direction}_{m7}_{m4}')
             #sizes = [16380] #visu_common.get_sizes(measurement_folder)
-            raw = measurement.read_meas_from_files(sizes, measurement_folder)
+            hist = cycle_hist.read_hists(sizes, measurement_folder)[0]
 
             plt.subplot(221 + i)
             dir_txt = 'M7 to M4' if direction=='s' else 'M4 to M7'
             title = f'Size:{sizes[0]} B, M7: {m7} MHz, M4: {m4} MHz, {dir_txt}'
-            histogram.histogram_intervals(raw, title)
+            histogram.histogram_intervals(hist, title)
             plt.xticks(rotation=12)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
-    
-    # =====================================================================
-    # initial plot to show difference between release and debug, long and short latency and datarate
-    configs = [{'mem': 'D3', 'clk': (240, 240)},
-               {'mem': 'D3_idcache_mpu_ncacheable_release', 'clk': (240, 240)},
-               {'mem': 'D3_idcache_mpu_ncacheable', 'clk': (240, 240)},]
-    filename = 'release_and_length_size.pdf'
+
+def histogram_inputs():
+    '''Input folders of the histogram figure'''
+    m7, m4 = HISTOGRAM_CLK
+    return CODE_INPUTS + [os.path.join(PILOT_PATH, HISTOGRAM_MEM,
+                                       f'meas_{direction}_{m7}_{m4}')
+                          for direction in ['r', 's']]
+
+# =====================================================================
+# initial plot to show difference between release and debug, long and short latency and datarate
+RELEASE_CONFIGS = [{'mem': 'D3', 'clk': (240, 240)},
+                   {'mem': 'D3_idcache_mpu_ncacheable_release', 'clk': (240, 240)},
+                   {'mem': 'D3_idcache_mpu_ncacheable', 'clk': (240, 240)},]
+
+def release_and_length_figure():
+    '''Release and debug, short and long sizes'''
+    configs = RELEASE_CONFIGS
     direction = 's'
     i = 0
     plt.figure(figsize=(10, 9.5), layout='tight')
@@ -66,52 +98,49 @@ def main():
             visu.final_size_func_foreach(configs, meas_type, direction,
                                         size_lambda=size_lambda, if_model=True)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
-
-    # =====================================================================
-    # size plot clock dependecy 
-    configs_all = [[{'mem': 'D1', 'clk': (240, 60)},
-                    {'mem': 'D1', 'clk': (120, 60)},
-                    {'mem': 'D1', 'clk': (480, 60)},],
-                   [{'mem': 'D1', 'clk': (240, 240)},
-                    {'mem': 'D1', 'clk': (240, 120)},
-                    {'mem': 'D1', 'clk': (240, 60)},],]
-    filename_all = ['clock_m7_size.pdf', 'clock_m4_size.pdf']
-    for conf_idx, (configs, filename) in enumerate(zip(configs_all, filename_all)):
-        i = 0
-        plt.figure(figsize=(10, 9.5), layout='tight')
-        for size_lambda, meas_type in zip([if_small_size, if_large_size],
-                                          ['latency', 'datarate']):
-            for direction in ['r', 's']:
-                ax = plt.subplot(221 + i)
-                if conf_idx == 0: # effect of m7 figure
-                    if meas_type == 'latency':
-                        plt.ylim(0, 180)
-                        plt.xticks(np.arange(5)*64)
-                    else:
-                        plt.ylim(0, 4)
-                        plt.xticks(np.arange(9)*2048, rotation=12)
+
+# =====================================================================
+# size plot clock dependecy 
+CLOCK_CONFIGS = [[{'mem': 'D1', 'clk': (240, 60)},
+                  {'mem': 'D1', 'clk': (120, 60)},
+                  {'mem': 'D1', 'clk': (480, 60)},],
+                 [{'mem': 'D1', 'clk': (240, 240)},
+                  {'mem': 'D1', 'clk': (240, 120)},
+                  {'mem': 'D1', 'clk': (240, 60)},],]
+
+def clock_size_figure(conf_idx):
+    '''Effect of the m7 (conf_idx 0) or m4 (conf_idx 1) clock'''
+    configs = CLOCK_CONFIGS[conf_idx]
+    i = 0
+    plt.figure(figsize=(10, 9.5), layout='tight')
+    for size_lambda, meas_type in zip([if_small_size, if_large_size],
+                                      ['latency', 'datarate']):
+        for direction in ['r', 's']:
+            ax = plt.subplot(221 + i)
+            if conf_idx == 0: # effect of m7 figure
+                if meas_type == 'latency':
+                    plt.ylim(0, 180)
+                    plt.xticks(np.arange(5)*64)
+                else:
+                    plt.ylim(0, 4)
+                    plt.xticks(np.arange(9)*2048, rotation=12)
+            else:
+                if meas_type == 'latency':
+                    plt.ylim(0, 190)
+                    plt.xticks(np.arange(5)*64)
                 else:
-                    if meas_type == 'latency':
-                        plt.ylim(0, 190)
-                        plt.xticks(np.arange(5)*64)
-                    else:
-                        plt.ylim(0, 14)
-                        plt.xticks(np.arange(9)*2048, rotation=12)
-                visu.final_size_func_foreach(configs, meas_type, direction,
-                                            size_lambda=size_lambda, if_model=True)
-                i = i + 1
-        out = os.path.join(FIGURES_PATH, filename)
-        if not os.path.exists(out):
-            plt.savefig(out)
-
-    # =====================================================================
-    # 3d clock dependency base
+                    plt.ylim(0, 14)
+                    plt.xticks(np.arange(9)*2048, rotation=12)
+            visu.final_size_func_foreach(configs, meas_type, direction,
+                                        size_lambda=size_lambda, if_model=True)
+            i = i + 1
+
+# =====================================================================
+# 3d clock dependency base
+def base_3d_figure():
+    '''Clock dependency in 3d for D3'''
     size = 256
     mems = visu_common.get_mems(MEASUREMENTS_PATH, r'D3')
-    filename = 'base_3d.pdf'
     i = 0
     fig = plt.figure(figsize=(10, 9.5), layout='tight')
     for meas_type in ['latency', 'datarate']:
@@ -124,16 +153,16 @@ def main():
                                     meas_type=meas_type, if_cut=True,
                                     stride=20)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
-
-    # =====================================================================
-    # difference between the memories plot for function of size 
-    configs = [{'mem': 'D1', 'clk': (240, 240)},
-               {'mem': 'D2', 'clk': (240, 240)},
-               {'mem': 'D3', 'clk': (240, 240)},]
-    filename = 'mems_size.pdf'
+
+# =====================================================================
+# difference between the memories plot for function of size 
+MEMS_CONFIGS = [{'mem': 'D1', 'clk': (240, 240)},
+                {'mem': 'D2', 'clk': (240, 240)},
+                {'mem': 'D3', 'clk': (240, 240)},]
+
+def mems_size_figure():
+    '''Memories in function of size'''
+    configs = MEMS_CONFIGS
     i = 0
     plt.figure(figsize=(10, 9.5), layout='tight')
     for size_lambda, meas_type in zip([if_small_size, if_large_size],
@@ -149,15 +178,13 @@ def main():
             visu.final_size_func_foreach(configs, meas_type, direction,
                                         size_lambda=size_lambda, if_model=True)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
 
-    # =====================================================================
-    # difference between the memories 3d
+# =====================================================================
+# difference between the memories 3d
+def memories_3d_figure():
+    '''Memories in 3d'''
     size = 4096
     mems = visu_common.get_mems(MEASUREMENTS_PATH, r'D[0-9]')
-    filename = 'memories_3d.pdf'
     i = 0
     fig = plt.figure(figsize=(10, 9.5), layout='tight')
     for meas_type in ['latency', 'datarate']:
@@ -172,15 +199,13 @@ def main():
                     clock_lambda=(lambda m7, m4: m7%120==0 and m4%60==0),
                     if_cut=False)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
 
-    # =====================================================================
-    # difference between the memories with cache and mpu
+# =====================================================================
+# difference between the memories with cache and mpu
+def memories_cache_3d_figure():
+    '''Memories with cache and mpu in 3d'''
     size = 16380
     mems = visu_common.get_mems(MEASUREMENTS_PATH, r'D[0-9]_idcache_mpu_ncacheable')
-    filename = 'memories_cache_3d.pdf'
     i = 0
     fig = plt.figure(figsize=(10, 9.5), layout='tight')
     for meas_type in ['latency', 'datarate']:
@@ -195,20 +220,20 @@ def main():
                     clock_lambda=(lambda m7, m4: m7%120==0 and m4%60==0),
                     if_cut=False)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
-
-    # =====================================================================
-    # for each memory the difference between all the options (2d only)
-    clks = (480, 240)
-    configs = [{'mem': 'D1_idcache_mpu_ncacheable', 'clk': clks},
-               {'mem': 'D2_idcache_mpu_ncacheable', 'clk': clks},
-               {'mem': 'D3_idcache_mpu_ncacheable', 'clk': clks},
-               {'mem': 'D1', 'clk': clks},
-               {'mem': 'D2', 'clk': clks},
-               {'mem': 'D3', 'clk': clks},]
-    filename = 'all_mems_size.pdf'
+
+# =====================================================================
+# for each memory the difference between all the options (2d only)
+ALL_MEMS_CLKS = (480, 240)
+ALL_MEMS_CONFIGS = [{'mem': 'D1_idcache_mpu_ncacheable', 'clk': ALL_MEMS_CLKS},
+                    {'mem': 'D2_idcache_mpu_ncacheable', 'clk': ALL_MEMS_CLKS},
+                    {'mem': 'D3_idcache_mpu_ncacheable', 'clk': ALL_MEMS_CLKS},
+                    {'mem': 'D1', 'clk': ALL_MEMS_CLKS},
+                    {'mem': 'D2', 'clk': ALL_MEMS_CLKS},
+                    {'mem': 'D3', 'clk': ALL_MEMS_CLKS},]
+
+def all_mems_size_figure():
+    '''Every memory option in function of size'''
+    configs = ALL_MEMS_CONFIGS
     i = 0
     plt.figure(figsize=(10, 9.5), layout='tight')
     for size_lambda, meas_type in zip([lambda size: size<=512, if_large_size],
@@ -224,12 +249,34 @@ def main():
             visu.final_size_func_foreach(configs, meas_type, direction,
                                         size_lambda=size_lambda, if_model=True)
             i = i + 1
-    out = os.path.join(FIGURES_PATH, filename)
-    if not os.path.exists(out):
-        plt.savefig(out)
 
-    # show graph
-    plt.show()
+TARGETS = [
+    figure_build.FigureTarget('histogram.pdf', histogram_figure,
+                              histogram_inputs),
+    figure_build.FigureTarget('release_and_length_size.pdf',
+                              release_and_length_figure,
+                              config_inputs(RELEASE_CONFIGS)),
+    figure_build.FigureTarget('clock_m7_size.pdf', clock_size_figure,
+                              config_inputs(CLOCK_CONFIGS[0]), {'conf_idx': 0}),
+    figure_build.FigureTarget('clock_m4_size.pdf', clock_size_figure,
+                              config_inputs(CLOCK_CONFIGS[1]), {'conf_idx': 1}),
+    figure_build.FigureTarget('base_3d.pdf', base_3d_figure, mem_inputs(r'D3')),
+    figure_build.FigureTarget('mems_size.pdf', mems_size_figure,
+                              config_inputs(MEMS_CONFIGS)),
+    figure_build.FigureTarget('memories_3d.pdf', memories_3d_figure,
+                              mem_inputs(r'D[0-9]')),
+    figure_build.FigureTarget('memories_cache_3d.pdf', memories_cache_3d_figure,
+                              mem_inputs(r'D[0-9]_idcache_mpu_ncacheable')),
+    figure_build.FigureTarget('all_mems_size.pdf', all_mems_size_figure,
+                              config_inputs(ALL_MEMS_CONFIGS)),
+]
+
+def main(if_force=False, workers=None):
+    '''Printing and writing out all final plots, only the figures with
+        changed inputs are rendered, in parallel processes'''
+    mem_regex = r'D[0-9](_idcache_mpu_ncacheable)?'
+    linear_model.print_table(MODEL_PATH, mem_regex)    
+    figure_build.build(TARGETS, if_force=if_force, workers=workers)
 
 if __name__ == '__main__':
     main()
@@ -4,37 +4,43 @@ import matplotlib.pyplot as plt
 import scipy.stats as stats
 
 from setup_paths import *
-import measurement
 import visu_common
+import cycle_hist
 
 def histogram(raw_meas, title):
     'Draws a histogram of the input raw measurement data'
+    histogram_counts(cycle_hist.CycleHistogram.from_samples(raw_meas), title)
+
+def histogram_counts(hist, title):
+    'Draws a precomputed CycleHistogram, one bar for each clk'
     plt.title(title)
     plt.xlabel('Latency in # of clk')
     plt.ylabel('Count')
-    bins = np.arange(raw_meas.min(), raw_meas.max() + 2) - 0.5
-    raw_meas = raw_meas.squeeze()
-    plt.hist(raw_meas, bins=bins, log=True, align='mid', label='measured data')
+    plt.bar(hist.values, hist.counts, width=1, align='center', log=True,
+            label='measured data')
     plt.grid()
     plt.legend(loc='upper right')
 
 def histogram_intervals(raw_meas, title, std_center=False):
-    'Histogram with std and confidence interval for the chosen sample size'
-    raw_meas = np.array(raw_meas)
+    '''Histogram with std and confidence interval for the chosen sample size,
+        raw_meas is the raw data or a CycleHistogram'''
+    if isinstance(raw_meas, cycle_hist.CycleHistogram):
+        hist = raw_meas
+    else:
+        hist = cycle_hist.CycleHistogram.from_samples(raw_meas)
 
-    mean = np.mean(raw_meas)
-    std = np.std(raw_meas)
-    conf_int = stats.norm.interval(0.95, loc=mean, scale=std/np.sqrt(1024))
+    mean = hist.mean
+    std = hist.std
+    conf_int = stats.norm.interval(0.95, loc=mean, scale=std/np.sqrt(hist.count))
     plt.axvline(mean, color='red', linestyle='-', label='Mean')
     plt.axvline(mean - std, color='green', linestyle='--', label='Mean ± Std')
     plt.axvline(mean + std, color='green', linestyle='--')
-    plt.axvline(conf_int[0], color='purple', linestyle='-.', label='95% CI for 1024 sample')
+    plt.axvline(conf_int[0], color='purple', linestyle='-.', label=f'95% CI for {hist.count} sample')
     plt.axvline(conf_int[1], color='purple', linestyle='-.')
     d = 5
     if std_center:
-        raw_meas = raw_meas[(mean-d*std < raw_meas) 
-                            & (raw_meas < mean+d*std)] # removing outlier
-    histogram(raw_meas, title)
+        hist = hist.between(mean-d*std, mean+d*std) # removing outlier
+    histogram_counts(hist, title)
     if std_center:
         plt.xlim(mean-d*std, mean+d*std)
     plt.ylim(5e-1, 1e5)
@@ -51,13 +57,13 @@ def main():
             for m7, m4 in clocks:
                 measurement_folder = os.path.join(dir_prefix, f'meas_{direction}_{m7}_{m4}')
                 sizes = [16380] #visu_common.get_sizes(measurement_folder)
-                raw = measurement.read_meas_from_files(sizes, measurement_folder)
+                hist = cycle_hist.read_hists(sizes, measurement_folder)[0]
 
                 # for raw_per_size, size in raw, sizes:
                 plt.figure()
                 dir_txt = 'M7 to M4' if direction=='s' else 'M4 to M7'
                 title = f'Size:{sizes[0]} B, M7: {m7} MHz, M4: {m4} MHz, {dir_txt}'
-                histogram_intervals(raw, title)
+                histogram_intervals(hist, title)
     plt.show()
 
 if __name__ == '__main__':
@@ -1,7 +1,27 @@
+import os
 import json
 import regex
 import numpy as np
 
+import tracing
+
+# clock ranges of the cores [MHz] for the inverse queries
+M7_CLOCKS = np.arange(1, 481)
+M4_CLOCKS = np.arange(1, 241)
+
+_json_cache = {}
+
+@tracing.traced
+def load_json(json_path):
+    '''Loads the model json, the content is kept in memory until the file
+        changes, the returned dict must not be modified'''
+    key = os.path.abspath(json_path)
+    mtime = os.stat(json_path).st_mtime_ns
+    if key not in _json_cache or _json_cache[key][0] != mtime:
+        with open(json_path, 'r') as file:
+            _json_cache[key] = (mtime, json.load(file))
+    return _json_cache[key][1]
+
 class LinearModel():
     '''Linear model'''
     def __init__(self, json_path, mem=None, direction=None):
@@ -10,9 +30,7 @@ class LinearModel():
 
     def load_params(self, json_path):
         '''Loads the model params from the json file'''
-        with open(json_path, 'r') as file:
-            params = json.load(file)
-        self.allparams = params
+        self.allparams = load_json(json_path)
 
     def set_model(self, mem, direction):
         '''Sets the model parameters for mem and direction'''
@@ -34,6 +52,7 @@ class LinearModel():
         '''Calculates the datarate based on the model'''
         return np.array(sizes)/self.get_latency(m7, m4, sizes)
     
+    @tracing.traced
     def get_output(self, m7, m4, sizes, meas_type):
         '''Calculates datarate or latency depending on meas_type'''
         if meas_type == 'latency':
@@ -54,6 +73,204 @@ class LinearModel():
         m4 = np.linspace(np.min(m4), np.max(m4), clock_res)
         return m7, m4, self.get_output(m7, m4, size, meas_type)
 
+    def get_min_m4(self, m7, sizes, budget, meas_type='latency',
+                   m4_clocks=M4_CLOCKS, clock_lambda=lambda m7, m4: m4 < m7):
+        '''Slowest available m4 clock meeting the budget with the given m7
+            clocks, the needed clock is solved in closed form and rounded
+            up to the available clocks, same as the m4 of get_pareto_clocks
+        Args:
+            budget: maximal latency [us] or minimal datarate [MB/s]
+            m4_clocks: the available clocks
+            clock_lambda: valid clock pairs, vectorized
+        Returns: np.array with shape (len(m7), len(sizes)), inf where no
+            valid available m4 clock is fast enough'''
+        m7 = np.reshape(m7, (-1, 1)).astype(float)
+        sizes = np.reshape(sizes, (1, -1))
+        latency_budget = _latency_budget(budget, sizes, meas_type)
+        m7_const, m7_variable, m4_variable, m4_const = self.params
+        # latency = m7_part/m7 + m4_part/m4 <= budget
+        m7_part = m7_const + m7_variable*sizes
+        m4_part = m4_const + m4_variable*sizes
+        remaining = latency_budget - m7_part/m7
+        with np.errstate(divide='ignore'):
+            needed = np.where(remaining > 0, m4_part / remaining, np.inf)
+        # shape (len(m7), len(sizes), len(m4_clocks))
+        m4_clocks = np.sort(m4_clocks).astype(float)
+        valid = (m4_clocks >= needed[..., np.newaxis]) \
+                & clock_lambda(m7[..., np.newaxis], m4_clocks)
+        return np.where(valid, m4_clocks, np.inf).min(axis=-1)
+
+    @tracing.traced
+    def get_pareto_clocks(self, size, budget, meas_type='latency',
+                          m7_clocks=M7_CLOCKS, m4_clocks=M4_CLOCKS,
+                          clock_lambda=lambda m7, m4: m4 < m7):
+        '''Pareto frontier of the clock pairs meeting the budget, no other
+            valid pair meeting the budget has both clocks lower or equal
+        Args:
+            size: sent data size
+            budget: maximal latency [us] or minimal datarate [MB/s]
+            m7_clocks, m4_clocks: the available clocks
+            clock_lambda: valid clock pairs, vectorized, the default is the
+                cut of visu_3d.model_grid
+        Returns: list of (m7, m4, output) with increasing m7'''
+        m7_clocks, m4_clocks = np.sort(m7_clocks), np.sort(m4_clocks)
+        latency = self.get_latency(m7_clocks, m4_clocks, [size])
+        latency = latency.reshape((len(m7_clocks), len(m4_clocks)))
+        front = pareto_mask(latency, m7_clocks, m4_clocks,
+                            _latency_budget(budget, size, meas_type),
+                            clock_lambda)
+        output = _output_from_latency(latency, size, meas_type)
+        m7_idx, m4_idx = np.nonzero(front)
+        return [(int(m7_clocks[i]), int(m4_clocks[j]), float(output[i, j]))
+                for i, j in zip(m7_idx, m4_idx)]
+
+    def get_cheapest_clocks(self, size, budget, meas_type='latency',
+                            weights=(1, 1), **kwargs):
+        '''Clock pair on the Pareto frontier with the lowest weighted sum
+            of the clocks, kwargs are passed to get_pareto_clocks
+        Returns: (m7, m4, output) or None if the budget can not be met'''
+        front = self.get_pareto_clocks(size, budget, meas_type, **kwargs)
+        if not front:
+            return None
+        return min(front, key=lambda point: weights[0]*point[0]
+                                            + weights[1]*point[1])
+
+def _latency_budget(budget, sizes, meas_type):
+    '''Converts a latency or datarate budget to a latency budget [us]'''
+    if meas_type == 'latency':
+        return np.asarray(budget, dtype=float)
+    elif meas_type == 'datarate':
+        return np.asarray(sizes) / budget
+    else:
+        raise RuntimeError('Invalid measurement type')
+
+def pareto_mask(latency, m7_clocks, m4_clocks, latency_budget,
+                clock_lambda=lambda m7, m4: m4 < m7):
+    '''Marks the Pareto frontier of the clock pairs meeting the budget
+    Args:
+        latency: np.array with shape (..., len(m7_clocks), len(m4_clocks))
+        m7_clocks, m4_clocks: increasing clocks
+        latency_budget: broadcastable to the leading axes of latency
+    Returns: boolean np.array with the shape of latency'''
+    m7_grid, m4_grid = np.meshgrid(m7_clocks, m4_clocks, indexing='ij')
+    budget = np.asarray(latency_budget)[..., np.newaxis, np.newaxis]
+    feasible = (latency <= budget) & clock_lambda(m7_grid, m4_grid)
+    # slowest m4 for each m7, only better than every slower m7 if on front
+    min_m4 = np.where(feasible, m4_grid, np.inf).min(axis=-1)
+    best_before = np.minimum.accumulate(min_m4, axis=-1)
+    best_before = np.concatenate(
+        (np.full(min_m4.shape[:-1] + (1,), np.inf), best_before[..., :-1]),
+        axis=-1)
+    on_front = np.isfinite(min_m4) & (min_m4 < best_before)
+    return feasible & (m4_grid == min_m4[..., np.newaxis]) \
+           & on_front[..., np.newaxis]
+
+class ModelRegistry():
+    '''Parameters of every mem and direction of a model json in one tensor,
+        for predictions over the whole configuration space at once'''
+    def __init__(self, json_path):
+        allparams = load_json(json_path)
+        self.json_path = json_path
+        self.mems = list(allparams)
+        self.directions = sorted({direction for mem_params in allparams.values()
+                                  for direction in mem_params})
+        # shape (mem, direction, 4), nan for missing models
+        self.params = np.full((len(self.mems), len(self.directions), 4), np.nan)
+        for i, mem in enumerate(self.mems):
+            for j, direction in enumerate(self.directions):
+                if direction in allparams[mem]:
+                    self.params[i, j] = allparams[mem][direction]
+
+    def _select(self, mems, directions):
+        '''Returns the params of the mems and directions, the shape of the
+            broadcast mems and directions plus the parameter axis'''
+        mem_idx = np.vectorize(self.mems.index, otypes=[int])(mems)
+        dir_idx = np.vectorize(self.directions.index, otypes=[int])(directions)
+        return self.params[mem_idx, dir_idx]
+
+    def get_model(self, mem, direction):
+        '''Returns a LinearModel for one mem and direction'''
+        return LinearModel(self.json_path, mem, direction)
+
+    def get_latency(self, mems, directions, m7, m4, sizes):
+        '''Latency for every combination of the inputs
+        Returns: np.array with shape
+            (len(mems), len(directions), len(m7), len(m4), len(sizes))'''
+        params = self._select(np.reshape(mems, (-1, 1)),
+                              np.reshape(directions, (1, -1)))
+        params = params.reshape(params.shape[:2] + (1, 1, 1, 4))
+        m7 = np.reshape(m7, (-1, 1, 1)).astype(float)
+        m4 = np.reshape(m4, (1, -1, 1)).astype(float)
+        sizes = np.reshape(sizes, (1, 1, -1))
+        return self._latency(params, m7, m4, sizes)
+
+    def get_latency_points(self, mems, directions, m7, m4, sizes):
+        '''Latency for configurations given elementwise, e.g. a list of
+            (mem, direction, m7, m4) configs, for each of the sizes
+        Args:
+            mems, directions, m7, m4: broadcastable to the same shape
+        Returns: np.array with the broadcast shape plus len(sizes)'''
+        mems, directions, m7, m4 = np.broadcast_arrays(mems, directions,
+                                                       m7, m4)
+        params = self._select(mems, directions)[..., np.newaxis, :]
+        m7 = m7[..., np.newaxis].astype(float)
+        m4 = m4[..., np.newaxis].astype(float)
+        return self._latency(params, m7, m4, np.asarray(sizes))
+
+    @staticmethod
+    def _latency(params, m7, m4, sizes):
+        '''The model, params in the last axis'''
+        m7_const, m7_variable, m4_variable, m4_const = np.moveaxis(params, -1, 0)
+        return m7_const/m7 + m4_const/m4 \
+               + m7_variable/m7*sizes + m4_variable/m4*sizes
+
+    @tracing.traced
+    def get_output(self, mems, directions, m7, m4, sizes, meas_type):
+        '''Datarate or latency for every combination, see get_latency'''
+        latency = self.get_latency(mems, directions, m7, m4, sizes)
+        return _output_from_latency(latency, sizes, meas_type)
+
+    @tracing.traced
+    def get_output_points(self, mems, directions, m7, m4, sizes, meas_type):
+        '''Datarate or latency for configurations, see get_latency_points'''
+        latency = self.get_latency_points(mems, directions, m7, m4, sizes)
+        return _output_from_latency(latency, sizes, meas_type)
+
+    @tracing.traced
+    def get_pareto_clocks(self, mems, directions, sizes, budget,
+                          meas_type='latency', m7_clocks=M7_CLOCKS,
+                          m4_clocks=M4_CLOCKS,
+                          clock_lambda=lambda m7, m4: m4 < m7):
+        '''Pareto frontier of LinearModel.get_pareto_clocks for every mem,
+            direction and size, evaluated in one broadcast call
+        Returns: dict of (mem, direction, size) to list of (m7, m4, output)'''
+        m7_clocks, m4_clocks = np.sort(m7_clocks), np.sort(m4_clocks)
+        # (mem, direction, size, m7, m4)
+        latency = np.moveaxis(self.get_latency(mems, directions, m7_clocks,
+                                               m4_clocks, sizes), -1, 2)
+        latency_budget = _latency_budget(budget, np.asarray(sizes), meas_type)
+        front = pareto_mask(latency, m7_clocks, m4_clocks, latency_budget,
+                            clock_lambda)
+        output = _output_from_latency(
+            latency, np.reshape(sizes, (-1, 1, 1)), meas_type)
+        result = {(mem, direction, size): []
+                  for mem in mems for direction in directions for size in sizes}
+        for i, j, k, l, m in zip(*np.nonzero(front)):
+            result[(mems[i], directions[j], sizes[k])].append(
+                (int(m7_clocks[l]), int(m4_clocks[m]),
+                 float(output[i, j, k, l, m])))
+        return result
+
+def _output_from_latency(latency, sizes, meas_type):
+    '''Returns the latency or the datarate calculated from it, sizes are
+        along the last axis'''
+    if meas_type == 'latency':
+        return latency
+    elif meas_type == 'datarate':
+        return np.asarray(sizes) / latency
+    else:
+        raise RuntimeError('Invalid measurement type')
+
 def print_table(json_path, mem_regex):
     '''Print latex table from the json file, memories can be filtered with mem_regex'''
     pattern = regex.compile(pattern=mem_regex)
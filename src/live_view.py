@@ -0,0 +1,225 @@
+import time
+import threading
+import numpy as np
+import matplotlib.pyplot as plt
+
+from matplotlib.collections import LineCollection
+
+import measurement
+import online_stats
+
+class SampleRing():
+    '''Bounded ring buffer of the samples between the acquisition and the
+        UI thread, the writer never waits: the oldest samples are
+        overwritten and the reader skips what it could not copy in time'''
+    def __init__(self, capacity=1 << 16):
+        self.buffer = np.zeros(capacity, dtype=measurement.SAMPLE_DTYPE)
+        # written in chunks, a copy by the reader can only race the chunk
+        # being written
+        self.chunk = max(1, capacity // 4)
+        self.written = 0 # number of pushed samples, only the writer sets it
+        self.points = [] # (direction, size, index of the first sample)
+
+    def start_point(self, direction, sent_data_size):
+        '''Marks the following samples as the samples of the point'''
+        self.points.append((direction, sent_data_size, self.written))
+
+    def add(self, sample):
+        '''Pushes one sample, same interface as OnlineStats.add'''
+        self.buffer[self.written % len(self.buffer)] = sample
+        self.written += 1
+
+    def add_batch(self, samples):
+        '''Pushes an array of samples, same interface as OnlineStats'''
+        capacity = len(self.buffer)
+        for begin in range(0, len(samples), self.chunk):
+            chunk = samples[begin:begin + self.chunk]
+            idx = np.arange(self.written, self.written + len(chunk)) % capacity
+            self.buffer[idx] = chunk
+            self.written += len(chunk)
+
+    def read(self, since):
+        '''Copies the samples pushed since the given index
+        Returns: (first index of the copied samples, samples)'''
+        capacity = len(self.buffer)
+        end = self.written
+        begin = max(since, end - capacity)
+        samples = self.buffer[np.arange(begin, end) % capacity]
+        # the samples the writer may have overwritten during the copy
+        overwritten = self.written + self.chunk - capacity
+        if overwritten > begin:
+            samples = samples[overwritten - begin:]
+            begin = overwritten
+        return begin, samples
+
+class LiveView():
+    '''Running histogram of the current point and the mean, min, max of
+        every point, redrawn with blitting at a capped frame rate'''
+    def __init__(self, ring, num_points, fps=10):
+        '''
+        Args:
+            ring: SampleRing filled by the acquisition
+            num_points: number of points of the measurement
+            fps: maximum number of frames per second'''
+        self.ring = ring
+        self.frame_time = 1 / fps
+        self.stats = [] # OnlineStats of each started point
+        self.read_idx = 0
+        self.dropped = 0
+        self.fig, (self.hist_ax, self.range_ax) = plt.subplots(
+            1, 2, figsize=(12, 5), layout='tight')
+        self.hist_ax.set_xlabel('Latency in # of clk')
+        self.hist_ax.set_ylabel('Count')
+        self.hist_ax.set_yscale('log')
+        self.hist_ax.grid()
+        self.range_ax.set_xlabel('Point')
+        self.range_ax.set_ylabel('Latency in # of clk')
+        self.range_ax.set_xlim(-0.5, num_points - 0.5)
+        self.range_ax.grid()
+        # animated artists are left out of the background
+        self.bars = self.hist_ax.stairs([0], [0, 1], baseline=0.5, fill=True,
+                                        animated=True)
+        self.title = self.hist_ax.text(0.5, 1.01, '', ha='center',
+                                       transform=self.hist_ax.transAxes,
+                                       animated=True)
+        self.ranges = LineCollection([], colors='tab:blue', animated=True)
+        self.range_ax.add_collection(self.ranges)
+        self.means, = self.range_ax.plot([], [], 'o', color='tab:red',
+                                         animated=True)
+        self.background = None
+
+    def _drain(self):
+        '''Moves the new samples of the ring into the stats of their points'''
+        begin, samples = self.ring.read(self.read_idx)
+        self.dropped += begin - self.read_idx
+        self.read_idx = begin + len(samples)
+        points = list(self.ring.points)
+        while len(self.stats) < len(points):
+            self.stats.append(online_stats.OnlineStats())
+        for i, (_, _, start) in enumerate(points):
+            stop = points[i + 1][2] if i + 1 < len(points) \
+                else begin + len(samples)
+            low = max(start, begin) - begin
+            high = min(stop, begin + len(samples)) - begin
+            if low < high:
+                self.stats[i].add_batch(samples[low:high])
+
+    def _limits(self):
+        '''Returns the axis limits needed by the current data'''
+        current = self.stats[-1]
+        x_margin = 0.1 * (current.max - current.min) + 5
+        done = [stats for stats in self.stats if stats.count]
+        y_low = min(stats.min for stats in done)
+        y_high = max(stats.max for stats in done)
+        y_margin = 0.1 * (y_high - y_low) + 5
+        return ((current.min - x_margin, current.max + x_margin),
+                (0.5, 2 * current.to_histogram().counts.max()),
+                (y_low - y_margin, y_high + y_margin))
+
+    def _rescale(self):
+        '''Redraws the whole figure with wider limits, saves the background'''
+        hist_x, hist_y, range_y = self._limits()
+        # twice the needed range, so full redraws are rare
+        width = hist_x[1] - hist_x[0]
+        center = (hist_x[0] + hist_x[1]) / 2
+        self.hist_ax.set_xlim(center - width, center + width)
+        self.hist_ax.set_ylim(0.5, 4 * hist_y[1])
+        self.range_ax.set_ylim(*range_y)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _if_outside(self):
+        '''Returns if the data left the current limits'''
+        hist_x, hist_y, range_y = self._limits()
+        x_low, x_high = self.hist_ax.get_xlim()
+        y_low, y_high = self.range_ax.get_ylim()
+        return hist_x[0] < x_low or hist_x[1] > x_high \
+            or hist_y[1] > self.hist_ax.get_ylim()[1] \
+            or range_y[0] < y_low or range_y[1] > y_high
+
+    def frame(self):
+        '''Draws the new samples, only the changed artists are rendered'''
+        self._drain()
+        if not self.stats or self.stats[-1].count == 0:
+            return
+        if self.background is None or self._if_outside():
+            self._rescale()
+        hist = self.stats[-1].to_histogram()
+        # a bin for each value and one empty bin for each gap between them
+        edges = np.unique(np.concatenate((hist.values - 0.5,
+                                          hist.values + 0.5)))
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        counts[np.searchsorted(edges, hist.values - 0.5)] = hist.counts
+        self.bars.set_data(counts, edges)
+        current = self.stats[-1]
+        direction, sent_data_size, _ = self.ring.points[-1]
+        dir_txt = 'M7 to M4' if direction == 's' else 'M4 to M7'
+        self.title.set_text(f'Size: {sent_data_size} B, {dir_txt}, '
+                            f'{current.count} samples, mean: {current.mean:.1f} '
+                            f'clk, dropped: {self.dropped}')
+        done = [(i, stats) for i, stats in enumerate(self.stats) if stats.count]
+        self.ranges.set_segments([[(i, stats.min), (i, stats.max)]
+                                  for i, stats in done])
+        self.means.set_data([i for i, _ in done],
+                            [stats.mean for _, stats in done])
+
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for artist in (self.bars, self.title, self.ranges, self.means):
+            artist.axes.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def run(self, acquisition):
+        '''Draws frames until the acquisition thread finishes'''
+        plt.show(block=False)
+        while acquisition.is_alive():
+            start = time.perf_counter()
+            self.frame()
+            # the gui stays responsive while waiting for the next frame
+            remaining = self.frame_time - (time.perf_counter() - start)
+            if remaining > 0:
+                self.fig.canvas.start_event_loop(remaining)
+        self.frame()
+
+def acquire(session, points, num_meas, ring, on_result):
+    '''Measures the points into the ring, runs in the acquisition thread
+    Args:
+        session: open MeasSession
+        points: list of (direction, size) tuples
+        on_result: called with (direction, size, response) of each point'''
+    for direction, sent_data_size in points:
+        ring.start_point(direction, sent_data_size)
+        samples = session.measure_samples(num_meas, sent_data_size, direction,
+                                          stats=ring)
+        response = [f'{direction}\r\n'.encode('ascii'),
+                    f'{num_meas}\r\r\n'.encode('ascii'),
+                    f'{sent_data_size}\r\r\n'.encode('ascii')]
+        response.extend(measurement.samples_to_lines(samples))
+        on_result(direction, sent_data_size, response)
+
+def run_live(session, points, num_meas, on_result, fps=10,
+             capacity=1 << 16, if_keep_open=True):
+    '''Measures the points in a background thread while the live view is
+        drawn in the calling thread, the acquisition never waits for the
+        rendering
+    Args:
+        if_keep_open: if the view is shown until closed after the end
+    Raises: the exception of the acquisition thread, if any'''
+    ring = SampleRing(capacity)
+    errors = []
+    def target():
+        try:
+            acquire(session, points, num_meas, ring, on_result)
+        except Exception as error: # re-raised in the calling thread
+            errors.append(error)
+    acquisition = threading.Thread(target=target, daemon=True)
+    view = LiveView(ring, len(points), fps)
+    acquisition.start()
+    view.run(acquisition)
+    acquisition.join()
+    if errors:
+        raise errors[0]
+    if if_keep_open:
+        plt.show()
+    return view
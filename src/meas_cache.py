@@ -0,0 +1,90 @@
+import os
+import glob
+import hashlib
+import numpy as np
+
+from setup_paths import *
+import tracing
+
+def _cache_key(filename):
+    '''Returns the cache key of the file, derived from its absolute path'''
+    return hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+
+def _cache_file(filename, cache_dir, suffix=''):
+    '''Returns the path of the cache entry, the size and mtime of the file are
+        part of the name, so a modified file never matches a stale entry'''
+    stat = os.stat(filename)
+    key = _cache_key(filename)
+    return os.path.join(cache_dir,
+                        f'{key}_{stat.st_size}_{stat.st_mtime_ns}{suffix}.npy')
+
+def _entry_suffix(entry, key):
+    '''Returns the suffix of a cache entry of the file with the key'''
+    # name is <key>_<size>_<mtime><suffix>.npy, suffixes start with _
+    parts = os.path.basename(entry)[len(key) + 1:-len('.npy')].split('_', 2)
+    return f'_{parts[2]}' if len(parts) == 3 else ''
+
+def remove_entries(filename, cache_dir=CACHE_PATH):
+    '''Removes all cache entries belonging to the file'''
+    pattern = os.path.join(cache_dir, f'{_cache_key(filename)}_*.npy')
+    for entry in glob.glob(pattern):
+        try:
+            os.remove(entry)
+        except OSError: # still memory mapped by someone, removed next time
+            pass
+
+def load_or_compute(filename, compute, suffix, cache_dir=CACHE_PATH):
+    '''Returns an array derived from the file, from the cache if the cache
+        entry is up to date
+    Args:
+        filename: path of the measurement log
+        compute: function of the filename returning an np.array, called on
+            a miss
+        suffix: name of the derived array starting with _, entries of the
+            file with other suffixes are kept
+        cache_dir: folder of the cached arrays
+    Returns: np.array, memory mapped if it was read from the cache, a
+        mapped array holds a file descriptor until it is freed, callers
+        keeping many of them have to copy them with np.array
+    Raises: OSError other than a missing entry, e.g. out of descriptors'''
+    cache_file = _cache_file(filename, cache_dir, suffix)
+    try:
+        values = np.load(cache_file, mmap_mode='r')
+        tracing.count('cache hits')
+        return values
+    except (FileNotFoundError, EOFError, ValueError): # missing or unreadable
+        pass
+    tracing.count('cache misses')
+    values = compute(filename)
+    # entries of older versions of the file
+    key = _cache_key(filename)
+    for entry in glob.glob(os.path.join(cache_dir, f'{key}_*.npy')):
+        if _entry_suffix(entry, key) != suffix or entry == cache_file:
+            continue
+        try:
+            os.remove(entry)
+        except OSError: # still memory mapped by someone, removed next time
+            pass
+    os.makedirs(cache_dir, exist_ok=True)
+    # writing to a temporary file first, readers never see partial entries
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as file:
+        np.save(file, values)
+    os.replace(tmp_file, cache_file)
+    return values
+
+def load_or_parse(filename, parse, cache_dir=CACHE_PATH):
+    '''Returns the parsed values of the file, from the binary cache if the
+        cache entry is up to date
+    Args:
+        filename: path of the measurement log
+        parse: function parsing the file into an np.array, called on a miss
+        cache_dir: folder of the cached arrays
+    Returns: np.array, memory mapped if it was read from the cache, see
+        load_or_compute'''
+    return load_or_compute(filename, parse, '', cache_dir)
+
+def clear(cache_dir=CACHE_PATH):
+    '''Removes every entry from the cache'''
+    for entry in glob.glob(os.path.join(cache_dir, '*.npy')):
+        os.remove(entry)
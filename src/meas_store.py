@@ -0,0 +1,115 @@
+import os
+import json
+import numpy as np
+
+from setup_paths import *
+import measurement
+import visu_common
+
+STORE_DTYPE = '<u4'
+
+def _store_files(store_path):
+    '''Returns the data and index file of the store'''
+    return store_path + '.bin', store_path + '.json'
+
+def import_campaign(measurements_path=MEASUREMENTS_PATH, store_path=STORE_PATH,
+                    mem_pattern=r'D[0-9]+.*', directions=('r', 's')):
+    '''Packs every measurement file of the campaign into one store
+    Args:
+        measurements_path: root folder of the <mem>/meas_<dir>_<m7>_<m4> tree
+        store_path: path of the store without extension
+        mem_pattern: pattern of the memory folders to be imported
+        directions: directions to be imported
+    Returns: number of imported files'''
+    data_file, index_file = _store_files(store_path)
+    entries = []
+    offset = 0
+    with open(data_file + '.tmp', 'wb') as data:
+        for mem in sorted(visu_common.get_mems(measurements_path, mem_pattern)):
+            mem_path = os.path.join(measurements_path, mem)
+            for direction in directions:
+                clocks = visu_common.get_clocks_in_folder(
+                    mem_path, prefix=f'meas_{direction}_')
+                for m7, m4 in sorted(clocks):
+                    dir_prefix = os.path.join(mem_path,
+                                              f'meas_{direction}_{m7}_{m4}')
+                    sizes = sorted(visu_common.get_sizes(dir_prefix))
+                    values = measurement.read_meas_from_files(
+                        sizes, dir_prefix, use_cache=False)
+                    # one contiguous chunk for each file
+                    for size, meas_values in zip(sizes, values):
+                        chunk = np.asarray(meas_values, dtype=STORE_DTYPE)
+                        data.write(chunk.tobytes())
+                        entries.append([mem, direction, m7, m4, size,
+                                        offset, len(chunk)])
+                        offset += len(chunk)
+    with open(index_file + '.tmp', 'w') as file:
+        json.dump({'dtype': STORE_DTYPE, 'entries': entries}, file)
+    os.replace(data_file + '.tmp', data_file)
+    os.replace(index_file + '.tmp', index_file)
+    return len(entries)
+
+class MeasStore():
+    '''Read access to a store created by import_campaign, the data file is
+        memory mapped once, queries never open files'''
+    def __init__(self, store_path=STORE_PATH):
+        data_file, index_file = _store_files(store_path)
+        with open(index_file, 'r') as file:
+            index = json.load(file)
+        self.index = {}
+        for mem, direction, m7, m4, size, offset, count in index['entries']:
+            self.index[(mem, direction, m7, m4, size)] = (offset, count)
+        if os.path.getsize(data_file) > 0:
+            self.data = np.memmap(data_file, dtype=index['dtype'], mode='r')
+        else: # empty files can not be mapped
+            self.data = np.empty(0, dtype=index['dtype'])
+
+    def get(self, mem, direction, m7, m4, size):
+        '''Returns the measurement values of one file as a read-only view'''
+        offset, count = self.index[(mem, direction, m7, m4, size)]
+        return self.data[offset:offset + count]
+
+    def keys(self, mem=None, direction=None, clock=None, size=None):
+        '''Returns the sorted (mem, direction, m7, m4, size) keys, None matches
+            everything, otherwise a value or a list of values is accepted'''
+        def matches(value, query):
+            if query is None:
+                return True
+            if isinstance(query, list):
+                return value in query
+            return value == query
+        return sorted(key for key in self.index
+                      if matches(key[0], mem) and matches(key[1], direction)
+                      and matches(key[2:4], clock) and matches(key[4], size))
+
+    def select(self, mem=None, direction=None, clock=None, size=None):
+        '''Returns the matching keys and list of the measurement values'''
+        keys = self.keys(mem, direction, clock, size)
+        return keys, [self.get(*key) for key in keys]
+
+    def get_stacked(self, mem, direction, clocks, sizes):
+        '''Returns the values for each clock and size
+        Args:
+            clocks: list of (m7, m4) tuples
+            sizes: list of sizes
+        Returns:
+            np.array with shape (len(clocks), len(sizes), num_meas)'''
+        return np.array([[self.get(mem, direction, m7, m4, size)
+                          for size in sizes] for m7, m4 in clocks])
+
+    def mems(self):
+        '''Returns the memories in the store'''
+        return sorted({key[0] for key in self.index})
+
+    def clocks(self, mem, direction):
+        '''Returns the (m7, m4) clocks measured for mem and direction'''
+        return sorted({(key[2], key[3]) for key in self.index
+                       if key[0] == mem and key[1] == direction})
+
+    def sizes(self, mem, direction, m7, m4):
+        '''Returns the sizes measured for mem, direction and clocks'''
+        return sorted(key[4] for key in self.index
+                      if key[:4] == (mem, direction, m7, m4))
+
+if __name__ == '__main__':
+    print(f'imported {import_campaign()} files')
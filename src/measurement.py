@@ -1,8 +1,19 @@
 import os
+import zlib
+import collections
+import struct
+import functools
 import serial
 import numpy as np
+import scipy.stats as stats
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from setup_paths import *
+import meas_cache
+import online_stats
+import tracing
+import binlog
 
 class SerialConfig:
     '''Class holding the data neccessary for the serial configuration'''
@@ -14,129 +25,615 @@ class SerialConfig:
         self.parity = parity
         self.stopbits = stopbits
 
-def measure(num_meas, sent_data_size, serial_config, meas_direction) -> list:
+# binary mode, selected by the upper case direction char, the results are
+# sent as one frame: magic, payload length, uint32 samples, crc32 of payload
+FRAME_MAGIC = b'IPCB'
+FRAME_HEADER = struct.Struct('<4sI')
+FRAME_CRC = struct.Struct('<I')
+SAMPLE_DTYPE = '<u4'
+
+class FrameError(RuntimeError):
+    '''Error raised for corrupted or incomplete binary result frames'''
+
+def _read_exactly(ser, size):
+    '''Reads size bytes, raises FrameError if the port timed out'''
+    data = ser.read(size)
+    if len(data) != size:
+        raise FrameError(f'timeout, received {len(data)} of {size} bytes')
+    return data
+
+def handshake(ser, num_meas, sent_data_size, meas_direction) -> list:
+    '''Sends the direction, repetition and size, returns the echoed lines
+    Args:
+        meas_direction: 'r' or 's', upper case for binary results'''
+    response = []
+    # start char
+    ser.write(meas_direction.encode('ascii'))
+    response.append(ser.readline())
+    # number of measurement repetition
+    string_to_send = f'{num_meas}\r'.encode('ascii')
+    ser.write(string_to_send)
+    response.append(ser.readline())
+    # measured data size
+    string_to_send = f'{sent_data_size}\r'.encode('ascii')
+    ser.write(string_to_send)
+    response.append(ser.readline())
+    return response
+
+@tracing.traced
+def read_frame(ser, num_meas, out=None):
+    '''Reads one binary result frame straight into a NumPy buffer
+    Args:
+        num_meas: expected number of samples
+        out: optional buffer of num_meas SAMPLE_DTYPE values
+    Returns: np.array of the samples
+    Raises: FrameError for wrong magic, length or crc'''
+    magic, length = FRAME_HEADER.unpack(_read_exactly(ser, FRAME_HEADER.size))
+    if magic != FRAME_MAGIC:
+        raise FrameError(f'wrong frame magic {magic!r}')
+    if out is None:
+        out = np.empty(num_meas, dtype=SAMPLE_DTYPE)
+    if length != out.nbytes:
+        raise FrameError(f'wrong frame length {length}, expected {out.nbytes}')
+    buffer = memoryview(out).cast('B')
+    received = 0
+    while received < length:
+        read_len = ser.readinto(buffer[received:])
+        if not read_len:
+            raise FrameError(f'timeout, received {received} of {length} bytes')
+        received += read_len
+    crc, = FRAME_CRC.unpack(_read_exactly(ser, FRAME_CRC.size))
+    if crc != zlib.crc32(buffer):
+        raise FrameError('crc mismatch')
+    return out
+
+def samples_to_lines(samples) -> list:
+    '''Formats samples like the lines sent in ascii mode'''
+    return [f'{sample}\r\n'.encode('ascii') for sample in samples]
+
+def measure(num_meas, sent_data_size, serial_config, meas_direction,
+            if_binary=False) -> list:
     '''Function for controlling measurement and collecting the results
     Args:
         sent_data_size: number of bytes sent
         num_meas: repetition time of the measurement
+        if_binary: if the results should be requested as one binary frame,
+            needs firmware support, ascii lines are read otherwise
+    Returns: the lines of the response, in binary mode the samples are
+        formatted like in ascii mode
     '''
-    response = []
     # Set up the serial connection
-    with serial.Serial(serial_config.port, serial_config.baud) as ser:
-        # start char
-        ser.write(meas_direction.encode('ascii')) #'r' or 's'
-        response.append(ser.readline())
-        # number of measurement repetition
-        string_to_send = f'{num_meas}\r'.encode('ascii')
-        ser.write(string_to_send)
-        response.append(ser.readline())
-        # measured data size
-        string_to_send = f'{sent_data_size}\r'.encode('ascii')
-        ser.write(string_to_send)
-        response.append(ser.readline())
-        for _ in range(num_meas):
-            response.append(ser.readline())
-    return response
+    with MeasSession(serial_config, if_binary=if_binary) as session:
+        return session.measure(num_meas, sent_data_size, meas_direction)
+
+class MeasSession():
+    '''Serial connection kept open for several measurements'''
+    def __init__(self, serial_config, if_binary=False):
+        '''Opens the port
+        Args:
+            if_binary: if the results are requested as binary frames'''
+        self.ser = serial.Serial(serial_config.port, serial_config.baud)
+        self.if_binary = if_binary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Closes the port'''
+        self.ser.close()
 
+    def _command(self, num_meas, sent_data_size, meas_direction):
+        '''Returns the whole handshake of a point as one write'''
+        if self.if_binary:
+            meas_direction = meas_direction.upper()
+        return f'{meas_direction}{num_meas}\r{sent_data_size}\r'.encode('ascii')
+
+    def _read_results(self, num_meas) -> list:
+        '''Reads the result lines of one point'''
+        if self.if_binary:
+            return samples_to_lines(read_frame(self.ser, num_meas))
+        return [self.ser.readline() for _ in range(num_meas)]
+
+    @tracing.traced
+    def measure(self, num_meas, sent_data_size, meas_direction) -> list:
+        '''Measures one point, same response as measure()'''
+        if self.if_binary:
+            meas_direction = meas_direction.upper()
+        response = handshake(self.ser, num_meas, sent_data_size, meas_direction)
+        return response + self._read_results(num_meas)
+
+    @tracing.traced
+    def measure_samples(self, num_meas, sent_data_size, meas_direction,
+                        stats=None):
+        '''Measures one point, returns the samples as np.array
+        Args:
+            stats: optional OnlineStats updated as the samples arrive'''
+        if self.if_binary:
+            handshake(self.ser, num_meas, sent_data_size, meas_direction.upper())
+            samples = read_frame(self.ser, num_meas)
+            if stats is not None:
+                stats.add_batch(samples)
+            return samples
+        handshake(self.ser, num_meas, sent_data_size, meas_direction)
+        samples = np.empty(num_meas, dtype=SAMPLE_DTYPE)
+        for i in range(num_meas):
+            samples[i] = int(self.ser.readline().split()[0])
+            if stats is not None:
+                stats.add(samples[i])
+        return samples
+
+    @tracing.traced
+    def measure_stats(self, num_meas, sent_data_size, meas_direction,
+                      stats=None):
+        '''Measures one point keeping only the summary of the samples
+        Args:
+            stats: OnlineStats to be updated, e.g. from an earlier run
+        Returns: OnlineStats'''
+        if stats is None:
+            stats = online_stats.OnlineStats()
+        if self.if_binary:
+            handshake(self.ser, num_meas, sent_data_size, meas_direction.upper())
+            stats.add_batch(read_frame(self.ser, num_meas))
+        else:
+            handshake(self.ser, num_meas, sent_data_size, meas_direction)
+            for _ in range(num_meas):
+                stats.add(int(self.ser.readline().split()[0]))
+        return stats
+
+    def sweep(self, points, num_meas, if_pipeline=False):
+        '''Measures several points over the open connection
+        Args:
+            points: list of (direction, size) tuples
+            num_meas: repetition count of each point
+            if_pipeline: if the next point's command is sent before the
+                current results are read, the firmware has to find it in its
+                receive buffer when it is done, a consumer stopping early
+                leaves one extra point queued on the board, needs firmware
+                support, the next command is sent after the results
+                otherwise
+        Yields: (direction, size, response) for each point in order'''
+        points = list(points)
+        if points:
+            self.ser.write(self._command(num_meas, points[0][1], points[0][0]))
+        for i, (direction, sent_data_size) in enumerate(points):
+            # the consumer's time between the points is not in the span
+            with tracing.span('MeasSession.sweep point', direction=direction,
+                              size=sent_data_size):
+                # direction, repetition and size echo
+                response = [self.ser.readline() for _ in range(3)]
+                next_command = None
+                if i + 1 < len(points):
+                    next_direction, next_size = points[i + 1]
+                    next_command = self._command(num_meas, next_size,
+                                                 next_direction)
+                if if_pipeline and next_command:
+                    self.ser.write(next_command)
+                response.extend(self._read_results(num_meas))
+                if not if_pipeline and next_command:
+                    self.ser.write(next_command)
+            yield direction, sent_data_size, response
+
+def ci_half_width(samples, confidence=0.95, quantile=None):
+    '''Half-width of the confidence interval of the mean, or of the quantile
+        if given, the quantile interval is taken from the order statistics
+    Returns: half-width in the unit of the samples'''
+    num = len(samples)
+    z = stats.norm.ppf(0.5 + confidence / 2)
+    if quantile is None:
+        return z * np.std(samples) / np.sqrt(num)
+    # ranks of the interval bounds, normal approximation of the binomial
+    spread = z * np.sqrt(num * quantile * (1 - quantile))
+    lower = int(np.clip(np.floor(num * quantile - spread), 0, num - 1))
+    upper = int(np.clip(np.ceil(num * quantile + spread), 0, num - 1))
+    ordered = np.partition(samples, (lower, upper))
+    return (float(ordered[upper]) - float(ordered[lower])) / 2
+
+@tracing.traced
+def measure_adaptive(session, sent_data_size, meas_direction, target,
+                     batch_size=256, min_meas=256, max_meas=16384,
+                     confidence=0.95, quantile=None):
+    '''Measures in batches until the confidence interval is narrow enough
+    Args:
+        session: open MeasSession
+        target: required CI half-width [timer clk]
+        batch_size: number of samples requested at once
+        min_meas: number of samples measured before the first check
+        max_meas: the measurement stops here even if the CI is wider
+        confidence: confidence level of the interval
+        quantile: CI of this quantile is checked instead of the mean's
+    Returns: (response, half_width) where the response is formatted like
+        in measure() with the total number of samples'''
+    batches = []
+    num_meas = 0
+    half_width = np.inf
+    while num_meas < max_meas:
+        batch = min(batch_size, max_meas - num_meas)
+        batches.append(session.measure_samples(batch, sent_data_size,
+                                               meas_direction))
+        num_meas += batch
+        if num_meas >= min_meas:
+            half_width = ci_half_width(np.concatenate(batches), confidence,
+                                       quantile)
+            if half_width <= target:
+                break
+    response = [f'{meas_direction}\r\n'.encode('ascii'),
+                f'{num_meas}\r\r\n'.encode('ascii'),
+                f'{sent_data_size}\r\r\n'.encode('ascii')]
+    response.extend(samples_to_lines(np.concatenate(batches)))
+    return response, half_width
+
+def meas_header(sent_data_size, num_meas, timer_clock, direction,
+                header_info=''):
+    '''Returns the first line of the measurement files'''
+    direction_info = 'M7 to M4' if 's' == direction else 'M4 to M7'
+    return f'Measurement repeated {num_meas} times, measured sending ' \
+           f'of {sent_data_size} bytes from {direction_info}, timer clock:' \
+           f'{timer_clock} MHz{header_info}\n'.encode('ascii')
+
+@tracing.traced
 def write_meas_to_file(dir_prefix, response, sent_data_size, num_meas,\
-                       timer_clock, direction):
-    '''Function for writing the measurement results similarly to putty
+                       timer_clock, direction, if_overwrite=True,
+                       header_info='', if_compact=False):
+    '''Function for writing the measurement results similarly to putty, the
+        file is written to a temporary file first and renamed, so an
+        interrupted write never leaves a partial file behind
     Args:
         timer_clock: timer clock frequency in MHz
         response: measurement data
         sent_data_size: number of bytes sent
         num_meas: repetition count of the measurement
-        direction: 'r' or 's' for the direction of the IPC communication'''
+        direction: 'r' or 's' for the direction of the IPC communication
+        if_overwrite: if an existing file can be replaced
+        header_info: text appended to the header line, e.g. the precision
+        if_compact: if the file is written in the compact binary format of
+            binlog, header_info is kept in its header
+    Raises: FileExistsError if the file exists and if_overwrite is False'''
     filename = f'meas{sent_data_size}.log'
     fullpath = os.path.join(dir_prefix, filename)
-    MODE = 'wb' if os.path.exists(fullpath) else 'xb'
-    with open(fullpath, MODE) as file:
-        # header
-        direction_info = 'M7 to M4' if 's' == direction else 'M4 to M7'
-        file.write(f'Measurement repeated {num_meas} times, measured sending ' \
-                f'of {sent_data_size} bytes from {direction_info}, timer clock:' \
-                f'{timer_clock} MHz\n'.encode('ascii'))
+    if_exists = os.path.exists(fullpath)
+    if if_exists and not if_overwrite:
+        raise FileExistsError(fullpath)
+    if if_compact:
+        # clocks of the meas_<dir>_<m7>_<m4> folder
+        m7, m4 = binlog.clocks_from_dir(dir_prefix)
+        samples = [int(line.split()[0]) for line in response[3:]]
+        header = binlog.LogHeader(direction.lower(), m7, m4, timer_clock,
+                                  sent_data_size, num_meas, header_info)
+        binlog.write_file(fullpath, header, samples)
+        print(f'{"overwritten" if if_exists else "written to"} {filename}')
+        return
+    tmp_path = f'{fullpath}.{os.getpid()}.tmp'
+    with open(tmp_path, 'xb') as file:
+        file.write(meas_header(sent_data_size, num_meas, timer_clock,
+                               direction, header_info))
         file.writelines(response)
-    print(f'written to {filename}')
+    os.replace(tmp_path, fullpath)
+    print(f'{"overwritten" if if_exists else "written to"} {filename}')
+
+def is_meas_complete(dir_prefix, sent_data_size, num_meas):
+    '''Returns if the measurement file exists and holds num_meas values
+        of the given size, None accepts any count matching the header'''
+    filename = os.path.join(dir_prefix, f'meas{sent_data_size}.log')
+    try:
+        values = parse_meas_file(filename, sent_data_size)
+    except (OSError, MeasFileError):
+        return False
+    return num_meas is None or len(values) == num_meas
+
+HEADER_LINES = 6 # header, direction, count, empty, size, empty
+MAX_DIGITS = 9 # longer values could overflow the uint32 buffer
+
+class MeasFileError(RuntimeError):
+    '''Error raised for measurement files that do not match their header
+        or the expected data size, or compact files that can not be
+        decoded'''
+    def __init__(self, filename, field, expected, actual) -> None:
+        super().__init__(f'{filename}: wrong {field}, expected {expected}, '
+                         f'got {actual}')
+        self.filename = filename
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+
+def _split_header(data, num_lines):
+    '''Splits the first lines of data, line endings are handled like in text
+        mode (\\n, \\r or \\r\\n)
+    Returns: list of the lines, offset of the first byte after them, None if
+        data does not contain enough lines'''
+    lines = []
+    pos = 0
+    while len(lines) < num_lines:
+        ends = [end for end in (data.find(b'\r', pos), data.find(b'\n', pos))
+                if end != -1]
+        if not ends:
+            return None
+        end = min(ends)
+        lines.append(data[pos:end])
+        pos = end + (2 if data[end:end + 2] == b'\r\n' else 1)
+    return lines, pos
+
+def _parse_header(filename, data):
+    '''Returns the repetition count, buffer length and body offset'''
+    split = _split_header(data, HEADER_LINES)
+    if split is None:
+        raise MeasFileError(filename, 'header', f'{HEADER_LINES} lines',
+                            'end of file')
+    lines, body_offset = split
+    try:
+        meas_length = int(lines[2]) # length of the measurement
+        read_buffer_len = int(lines[4])
+    except ValueError:
+        raise MeasFileError(filename, 'header', 'count and size',
+                            lines[2:5]) from None
+    return meas_length, read_buffer_len, body_offset
+
+def read_meas_header(filename):
+    '''Reads the header of a text or compact measurement file without
+        parsing the values
+    Returns: (repetition count, buffer length)'''
+    tracing.count('files opened')
+    with open(filename, 'rb') as file:
+        data = file.read(4096)
+        if binlog.is_binlog(data):
+            try:
+                if len(data) < binlog.header_size(data): # long header info
+                    data += file.read()
+                header = binlog.LogHeader.unpack(data)
+            except binlog.BinLogError as error:
+                raise MeasFileError(filename, error.field, error.expected,
+                                    error.actual) from None
+            return header.count, header.sent_data_size
+        if _split_header(data, HEADER_LINES) is None: # unusually long header
+            data += file.read()
+    meas_length, read_buffer_len, _ = _parse_header(filename, data)
+    return meas_length, read_buffer_len
 
+def _decode_first_column(filename, body, out):
+    '''Decodes the first number of each non-empty line of body into out,
+        the digits are processed column-wise for all lines at once'''
+    raw = np.frombuffer(body, dtype=np.uint8)
+    is_digit = (raw >= ord('0')) & (raw <= ord('9'))
+    edges = np.diff(is_digit.view(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    # only the first number of a line is the measurement value
+    newlines = np.flatnonzero((raw == ord('\n')) | (raw == ord('\r')))
+    line_idx = np.searchsorted(newlines, starts)
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = line_idx[1:] != line_idx[:-1]
+    starts, lengths = starts[first], lengths[first]
+
+    if len(starts) != len(out): # read data and expected length
+        raise MeasFileError(filename, 'file len', len(out), len(starts))
+    if len(lengths) and lengths.max() > MAX_DIGITS:
+        raise MeasFileError(filename, 'value', f'at most {MAX_DIGITS} digits',
+                            f'{lengths.max()} digits')
+    out[:] = 0
+    for digit_idx in range(lengths.max(initial=0)):
+        valid = lengths > digit_idx
+        digits = raw[starts[valid] + digit_idx] - ord('0')
+        out[valid] = out[valid] * 10 + digits
+    return out
+
+@tracing.traced
+def _decode_binlog(filename, data, buffer_len, out):
+    '''Decodes a compact measurement file, see parse_meas_file'''
+    try:
+        header, payload = binlog.read_payload(data)
+        if header.sent_data_size != buffer_len:
+            raise MeasFileError(filename, 'buffer size', buffer_len,
+                                header.sent_data_size)
+        if out is not None and len(out) != header.count:
+            raise MeasFileError(filename, 'file len', len(out), header.count)
+        return binlog.decode_samples(payload, header.count, out)
+    except binlog.BinLogError as error:
+        raise MeasFileError(filename, error.field, error.expected,
+                            error.actual) from None
+
+@tracing.traced
+def parse_meas_file(filename, buffer_len, out=None):
+    '''Parses one measurement file written by write_meas_to_file, in the
+        text or the compact format
+    Args:
+        filename: path of the measurement file
+        buffer_len: expected size of the sent data
+        out: optional np.uint32 buffer with the length of the measurement,
+            the values are decoded into it
+    Returns: np.array of the measurement values
+    Raises: MeasFileError if the file does not match its header'''
+    tracing.count('files opened')
+    with open(filename, 'rb') as file:
+        data = file.read()
+    tracing.count('bytes parsed', len(data))
+    if binlog.is_binlog(data):
+        return _decode_binlog(filename, data, buffer_len, out)
+    meas_length, read_buffer_len, body_offset = _parse_header(filename, data)
+    if read_buffer_len != buffer_len:
+        raise MeasFileError(filename, 'buffer size', buffer_len,
+                            read_buffer_len)
+    if out is None:
+        out = np.empty(meas_length, dtype=np.uint32)
+    elif len(out) != meas_length:
+        raise MeasFileError(filename, 'file len', len(out), meas_length)
+    body = memoryview(data)[body_offset:]
+    return _decode_first_column(filename, body, out)
+
+@tracing.traced
 def read_meas_from_files(sizes, dir_prefix,
-                         filename_prefix='meas') -> list[list]:
+                         filename_prefix='meas', use_cache=True) -> list:
     '''Read all files for the all data sizes
     Args:
         sizes: list of sizes to be measured
         dir_prefix: folder of the measurement files
         filename_prefix: common first part of the files containing the measurement values
-    Returns: a list of lists that contain all the measurement values'''
+        use_cache: if the parsed values should be read from and stored in
+            the binary cache, the log is only parsed if it changed
+    Returns: a list of np.arrays that contain all the measurement values,
+        memory mapped from the cache, copy them to keep many folders'''
     filenames = [os.path.join(dir_prefix, f'{filename_prefix}{x}.log') for x in sizes]
     all_meas_values = []
-    for i, filename in enumerate(filenames):
-        # cutting the expected datasize from the filename
-        buffer_len = sizes[i]
-
-        cur_meas_values = []
-        with open(filename, 'r', encoding='ascii') as file:
-            file.readline() # header
-            file.readline() # s
-            meas_length = int(file.readline()) # length of the measurement
-            file.readline() # empty line
-            read_buffer_len = int(file.readline())
-            if read_buffer_len != buffer_len:
-                print('Wrong buffer size')
-            file.readline() # empty line, could be left out
-            for line in file:
-                line = line.strip() # strip line ending
-                if line: # if not empty line
-                    line = line.split(sep=' ')[0]
-                    cur_meas_values.append(int(line))
-        if len(cur_meas_values) != meas_length: # read data and expected length
-            print('Wrong file len')
-        all_meas_values.append(cur_meas_values)
+    for filename, buffer_len in zip(filenames, sizes):
+        parse = lambda name: parse_meas_file(name, buffer_len)
+        if use_cache:
+            all_meas_values.append(meas_cache.load_or_parse(filename, parse))
+        else:
+            all_meas_values.append(parse(filename))
     return all_meas_values
 
-def get_and_calc_meas(timer_clock, dir_prefix, sizes, meas_type):
+def _read_request(measurements_path, request):
+    '''Reads the files of one (mem, direction, (m7, m4), sizes) request'''
+    mem, direction, (m7, m4), sizes = request
+    dir_prefix = os.path.join(measurements_path, mem,
+                              f'meas_{direction}_{m7}_{m4}')
+    values = np.array(read_meas_from_files(sizes, dir_prefix))
+    tracing.flush()
+    return values
+
+@tracing.traced
+def read_meas_parallel(requests, workers=None, if_processes=True,
+                       if_stack=False, measurements_path=MEASUREMENTS_PATH):
+    '''Reads the measurement files of several folders in parallel
+    Args:
+        requests: list of (mem, direction, (m7, m4), sizes) tuples
+        workers: number of worker processes or threads, None for the
+            number of processors
+        if_processes: process pool if True, thread pool otherwise
+        if_stack: if the results should be stacked into one array, every
+            request needs the same number of sizes and measurements
+        measurements_path: root folder of the measurements
+    Returns:
+        list of np.arrays with shape (len(sizes), num_meas) in the order of
+        the requests, or np.array with shape
+        (len(requests), len(sizes), num_meas) if if_stack is set'''
+    read = functools.partial(_read_request, measurements_path)
+    workers = workers or os.cpu_count() or 1
+    if if_processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # fewer round trips between the processes for many small requests
+        chunksize = max(1, len(requests) // (4 * workers))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        chunksize = 1
+    with executor:
+        # map keeps the order of the requests
+        results = list(executor.map(read, requests, chunksize=chunksize))
+    if if_stack:
+        return np.array(results)
+    return results
+
+SUMMARY_CACHE_SIZE = 4096 # number of files kept in the memory tier
+_summary_cache = collections.OrderedDict()
+
+def _reduce_meas_file(filename, buffer_len):
+    '''Returns np.array(mean, min, max) of the file in timer clks'''
+    values = meas_cache.load_or_parse(
+        filename, lambda name: parse_meas_file(name, buffer_len))
+    return np.array((np.mean(values), np.min(values), np.max(values)))
+
+def get_meas_summary(filename, buffer_len, if_persistent=True):
+    '''Returns np.array(mean, min, max) of the measurement file in timer
+        clks, memoized in a bounded LRU and optionally on disk, the entries
+        are keyed by the path, size and mtime of the file, so a changed file
+        is reduced again
+    Args:
+        if_persistent: if the on-disk tier in the cache folder is used'''
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), buffer_len, stat.st_size,
+           stat.st_mtime_ns)
+    if key in _summary_cache:
+        tracing.count('summary cache hits')
+        _summary_cache.move_to_end(key)
+        return _summary_cache[key]
+    reduce = lambda name: _reduce_meas_file(name, buffer_len)
+    if if_persistent:
+        summary = np.array(meas_cache.load_or_compute(filename, reduce,
+                                                      '_summary'))
+    else:
+        summary = reduce(filename)
+    _summary_cache[key] = summary
+    if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+        _summary_cache.popitem(last=False)
+    return summary
+
+def calc_meas(summaries, timer_clock, sizes, meas_type):
+    '''Calculates datarates or latencies from the mean, min, max clks
+    Args:
+        summaries: np.array of (mean, min, max) clks, shape: (3, len(sizes))
+    Returns:
+        np.array(mean, min, max), shape: (3, len(sizes))'''
+    sizes = np.asarray(sizes)
+    clk_mean, clk_min, clk_max = summaries
+    if 'datarate' == meas_type:
+        data_min = sizes / clk_max * timer_clock # Mbyte/s
+        data_max = sizes / clk_min * timer_clock # Mbyte/s
+        data_mean = sizes / clk_mean * timer_clock # Mbyte/s
+    elif 'latency' == meas_type:
+        data_mean = clk_mean / timer_clock # us
+        data_min = clk_min / timer_clock # us
+        data_max = clk_max / timer_clock # us
+    else:
+        raise RuntimeError('type not datarate of latency')
+    return np.array((data_mean, data_min, data_max))
+
+@tracing.traced
+def get_and_calc_meas(timer_clock, dir_prefix, sizes, meas_type,
+                      if_persistent=True):
     '''Reads measurement values (mean, min, max) and calculates datarates
-        or latencies
+        or latencies, the reduction of each file is memoized
 
     Args:
         timer_clock: timer clock frequency in [MHz]
         dir_prefix: name of the directory
         sizes: measured message sizes
         meas_type: 'datarate' or 'latency'
+        if_persistent: if the summaries are also cached on disk
 
     Returns:
         np.array(mean, min, max), shape: (3, len(sizes)) [Mbyte/s]'''
-    all_meas_values = np.array(read_meas_from_files(sizes, dir_prefix))
-    if 'datarate' == meas_type:
-        data_min = sizes / np.max(all_meas_values, axis=1) * timer_clock # Mbyte/s
-        data_max = sizes / np.min(all_meas_values, axis=1) * timer_clock # Mbyte/s
-        data_mean = sizes / np.mean(all_meas_values, axis=1) * timer_clock # Mbyte/s
-    elif 'latency' == meas_type:
-        data_mean = np.mean(all_meas_values, axis=1) / timer_clock # us
-        data_min = np.min(all_meas_values, axis=1) / timer_clock # us
-        data_max = np.max(all_meas_values, axis=1) / timer_clock # us
-    else:
-        raise RuntimeError('type not datarate of latency')
-    return np.array((data_mean, data_min, data_max))
+    summaries = np.array([get_meas_summary(
+                              os.path.join(dir_prefix, f'meas{size}.log'),
+                              size, if_persistent)
+                          for size in sizes]).reshape((len(sizes), 3)).T
+    return calc_meas(summaries, timer_clock, sizes, meas_type)
 
-def get_all_latencies(clocks, sizes, meas_num=1024,\
+@tracing.traced
+def get_all_latencies(clocks, sizes, meas_num=None,\
                       dir_prefix_without_clk='meas_'):
     '''Reads all measurement values for each clk and size
     Args:
         clocks: list of tuple of clks (m7, m4)
         sizes: list of sizes
-        meas_num: number of measurements in each file
+        meas_num: number of measurements kept from each file, the longest
+            file in the headers if None
         dir_prefix_without_clk: dir prefix without the clks 
             e.g. meas_ in case of meas_72_72
     Returns:
-        np.array() with size (len(clocks), len(sizes), num_meas)'''
-    all_latencies = np.empty((0, len(sizes), meas_num))
-    for m7, m4 in clocks:
-        new_meas_values = np.array( \
-            read_meas_from_files(sizes, f'{dir_prefix_without_clk}{m7}_{m4}'))
-        new_meas_values = np.expand_dims(new_meas_values, axis=0)
-        all_latencies = np.concatenate(
-            (all_latencies, new_meas_values / m4), axis=0) #us
-    return all_latencies
+        np.array() with size (len(clocks), len(sizes), meas_num), if the
+        files hold different number of measurements, np.ma.MaskedArray with
+        the missing values masked'''
+    dir_prefixes = [f'{dir_prefix_without_clk}{m7}_{m4}' for m7, m4 in clocks]
+    counts = np.array([[read_meas_header(
+                            os.path.join(dir_prefix, f'meas{size}.log'))[0]
+                        for size in sizes] for dir_prefix in dir_prefixes],
+                      dtype=int).reshape((len(clocks), len(sizes)))
+    if meas_num is None:
+        meas_num = counts.max(initial=0)
+    counts = np.minimum(counts, meas_num)
+
+    # allocated once, filled in place
+    all_latencies = np.zeros((len(clocks), len(sizes), meas_num))
+    for i, (dir_prefix, (_, m4)) in enumerate(zip(dir_prefixes, clocks)):
+        meas_values = read_meas_from_files(sizes, dir_prefix)
+        for j, values in enumerate(meas_values):
+            all_latencies[i, j, :counts[i, j]] = values[:counts[i, j]]
+        all_latencies[i] /= m4 #us
+    if np.all(counts == meas_num):
+        return all_latencies
+    mask = np.arange(meas_num) >= counts[..., np.newaxis]
+    return np.ma.MaskedArray(all_latencies, mask=mask)
 
 def upper_lower_from_minmax(mean_min_max):
     '''Calculates lower and upper error from min and max
@@ -152,9 +649,15 @@ def upper_lower_from_minmax(mean_min_max):
     mean_lower_upper[:, 2] = mean_min_max[:, 2] - mean_min_max[:, 0] # max - mean
     return mean_lower_upper
 
+def adaptive_result(session, sent_data_size, direction, target):
+    '''Adaptive measurement of one point for main()
+    Returns: response, header info with the achieved precision'''
+    response, half_width = measure_adaptive(session, sent_data_size,
+                                            direction, target)
+    return response, f', 95% CI half-width of mean: {half_width:.3f} clk'
+
 def main():
     '''Measuring for several different sizes, saving the result to file'''
-    serial_config = SerialConfig('COM5', 115200, 8, 'N', 1) 
     num_meas = 1024
 
     sizes_short = [1 if x==0 else 16*x for x in range(17)]
@@ -166,18 +669,51 @@ def main():
     meas_directions = ['r', 's']
     m7_clk = 120
     m4_clk = 120
+    if_resume = True # complete files are not measured again
+    adaptive_target = None # CI half-width of the mean [clk], None for fixed num_meas
+    if_binary = False # binary frames need firmware support
+    if_live = False # live histogram while measuring, fixed num_meas only
+    if_pipeline = False # pipelined commands need firmware support
+    baud = 921600 if if_binary else 115200
     #config end
+    serial_config = SerialConfig('COM5', baud, 8, 'N', 1)
     timer_clock = m4_clk
 
-    for direction in meas_directions:
-        for sent_data_size in sizes:
-            dir_prefix = f'meas_{direction}_{m7_clk}_{m4_clk}' #'tmp_meas'
-            dir_prefix = os.path.join(MEASUREMENTS_PATH, memory, dir_prefix)
-            if not os.path.exists(dir_prefix):
-                os.makedirs(dir_prefix)
-            response = measure(num_meas, sent_data_size, serial_config, direction)
-            write_meas_to_file(dir_prefix, response, sent_data_size, num_meas, \
-                            timer_clock, direction)
+    points = [(direction, sent_data_size) for direction in meas_directions
+              for sent_data_size in sizes]
+    if if_resume:
+        points = [(direction, sent_data_size) for direction, sent_data_size
+                  in points if not is_meas_complete(os.path.join(
+                      MEASUREMENTS_PATH, memory,
+                      f'meas_{direction}_{m7_clk}_{m4_clk}'),
+                      sent_data_size,
+                      num_meas if adaptive_target is None else None)]
+
+    def write_result(direction, sent_data_size, response, header_info=''):
+        dir_prefix = f'meas_{direction}_{m7_clk}_{m4_clk}' #'tmp_meas'
+        dir_prefix = os.path.join(MEASUREMENTS_PATH, memory, dir_prefix)
+        if not os.path.exists(dir_prefix):
+            os.makedirs(dir_prefix)
+        write_meas_to_file(dir_prefix, response, sent_data_size,
+                           len(response) - 3, timer_clock, direction,
+                           header_info=header_info)
+
+    with MeasSession(serial_config, if_binary=if_binary) as session:
+        if if_live:
+            import live_view # matplotlib is only needed for the live view
+            live_view.run_live(session, points, num_meas, write_result)
+            return
+        if adaptive_target is None:
+            results = ((direction, sent_data_size, response, '')
+                       for direction, sent_data_size, response
+                       in session.sweep(points, num_meas,
+                                        if_pipeline=if_pipeline))
+        else:
+            results = ((direction, sent_data_size, *adaptive_result(
+                        session, sent_data_size, direction, adaptive_target))
+                       for direction, sent_data_size in points)
+        for direction, sent_data_size, response, header_info in results:
+            write_result(direction, sent_data_size, response, header_info)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,151 @@
+import os
+import json
+import functools
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from setup_paths import *
+import visu_common
+import linear_model
+import model_fit
+
+# module level filters, lambdas can not be sent to worker processes
+def _default_clocks(m7, m4):
+    '''Clock filter of the regression notebook'''
+    return m4 >= 60
+
+def _all_sizes(size):
+    '''Size filter keeping every size'''
+    return True
+
+def _load_one(measurements_path, clock_lambda, key):
+    '''Loads the points of one (mem, direction)'''
+    mem, direction = key
+    return model_fit.load_points(mem, direction, measurements_path,
+                                 clock_lambda=clock_lambda)
+
+def load_dataset(mems, directions=('r', 's'), measurements_path=MEASUREMENTS_PATH,
+                 clock_lambda=_default_clocks, workers=None):
+    '''Loads the mean latencies of every mem and direction once, in parallel
+        worker processes, clock_lambda has to be picklable if workers is not
+        1, e.g. a module level function
+    Returns: dict of (mem, direction) to (m7, m4, sizes, latency) arrays'''
+    keys = [(mem, direction) for mem in mems for direction in directions]
+    load = functools.partial(_load_one, measurements_path, clock_lambda)
+    if workers == 1:
+        return dict(zip(keys, map(load, keys)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(keys, executor.map(load, keys)))
+
+def _normalized_mse(pred, y):
+    '''MSE divided by the mean of the measured latencies, like the
+        mse json files'''
+    return float(linear_model.get_mse(pred, y, axis=0) / np.mean(y))
+
+def clock_folds(m7, m4, num_folds=None, seed=0):
+    '''Splits the points by their clock pair
+    Args:
+        num_folds: number of folds with several clock pairs each, leave one
+            clock out if None
+    Returns: dict of fold name to boolean test mask'''
+    pairs = [(int(c7), int(c4)) for c7, c4 in zip(m7, m4)]
+    clocks = sorted(set(pairs))
+    if num_folds is None:
+        return {f'{c7}_{c4}': np.array([pair == (c7, c4) for pair in pairs],
+                                       dtype=bool)
+                for c7, c4 in clocks}
+    order = np.random.default_rng(seed).permutation(len(clocks))
+    folds = {}
+    for fold in range(num_folds):
+        fold_clocks = {clocks[i] for i in order[fold::num_folds]}
+        folds[f'fold{fold}'] = np.array([pair in fold_clocks for pair in pairs],
+                                        dtype=bool)
+    return folds
+
+def _cross_validate_one(num_folds, seed, test_size_lambda, points):
+    '''Cross-validation of one (mem, direction) in a worker process
+    Returns: dict of fold name to normalized test mse'''
+    m7, m4, sizes, y = points
+    test_sizes = np.vectorize(test_size_lambda, otypes=[bool])(sizes) \
+        if len(sizes) else np.zeros(0, dtype=bool)
+    K = model_fit.design_matrix(m7, m4, sizes)
+    result = {}
+    for name, test in clock_folds(m7, m4, num_folds, seed).items():
+        train = ~test
+        test = test & test_sizes
+        if np.count_nonzero(train) < 4 or not np.any(test):
+            continue
+        params = model_fit.fit_batch({0: (K[train], y[train])})[0]
+        result[name] = _normalized_mse(K[test] @ params, y[test])
+    return result
+
+def cross_validate(dataset, num_folds=None, seed=0,
+                   test_size_lambda=_all_sizes, workers=None):
+    '''Cross-validation of the linear model for every mem and direction, the
+        (mem, direction) problems run in parallel worker processes
+    Args:
+        dataset: output of load_dataset, reused by every fold
+        num_folds: k of the k-fold split of the clock pairs, leave one clock
+            out if None
+        test_size_lambda: sizes the mse is calculated for, has to be
+            picklable if workers is not 1
+    Returns: dict of fold name to mse table {mem: {direction: mse}}, with
+        the mean of the folds under 'mean' '''
+    keys = list(dataset)
+    validate = functools.partial(_cross_validate_one, num_folds, seed,
+                                 test_size_lambda)
+    if workers == 1:
+        results = list(map(validate, dataset.values()))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(validate, dataset.values()))
+    tables = {}
+    for (mem, direction), fold_mses in zip(keys, results):
+        for name, mse in fold_mses.items():
+            tables.setdefault(name, {}).setdefault(mem, {})[direction] = mse
+        if fold_mses:
+            tables.setdefault('mean', {}).setdefault(mem, {})[direction] = \
+                float(np.mean(list(fold_mses.values())))
+    return tables
+
+def evaluate_model(json_path, dataset, test_size_lambda=_all_sizes):
+    '''Normalized mse of a fitted model json on the loaded data
+    Returns: mse table {mem: {direction: mse}} like mse256.json'''
+    registry = linear_model.ModelRegistry(json_path)
+    table = {}
+    for (mem, direction), (m7, m4, sizes, y) in dataset.items():
+        if mem not in registry.mems:
+            continue
+        test = np.array([test_size_lambda(size) for size in sizes], dtype=bool)
+        if not np.any(test):
+            continue
+        pred = registry.get_latency_points(mem, direction, m7[test], m4[test],
+                                           sizes[test][:, np.newaxis])[..., 0]
+        table.setdefault(mem, {})[direction] = _normalized_mse(pred, y[test])
+    return table
+
+def write_table(table, path):
+    '''Writes an mse table in the format of the mse json files'''
+    with open(path, 'w') as file:
+        json.dump(table, file, indent=4)
+
+def _is_short(size):
+    '''Test sizes of the mse256 tables'''
+    return size <= 256
+
+def main():
+    '''Cross-validating the model and evaluating the saved model files'''
+    mems = visu_common.get_mems(MEASUREMENTS_PATH,
+                                pattern=r'D[0-9](_idcache_mpu_ncacheable)?')
+    dataset = load_dataset(mems)
+    tables = cross_validate(dataset, test_size_lambda=_is_short)
+    write_table(tables, os.path.join(MODELS_PATH, 'cv_mse256.json'))
+    print(tables['mean'])
+    for json_path in ['models.json', 'models_long.json']:
+        table = evaluate_model(os.path.join(MODELS_PATH, json_path), dataset,
+                               test_size_lambda=_is_short)
+        print(json_path, table)
+
+if __name__ == '__main__':
+    main()
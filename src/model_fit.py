@@ -0,0 +1,227 @@
+import os
+import json
+import numpy as np
+import scipy
+
+from setup_paths import *
+import measurement
+import visu_common
+
+def design_matrix(m7, m4, sizes):
+    '''Rows of the linear model for each point, same column order as the
+        parameters: m7 const, m7 variable, m4 variable, m4 const
+    Args:
+        m7, m4, sizes: arrays of the same length
+    Returns: np.array with shape (len(sizes), 4)'''
+    m7, m4, sizes = (np.asarray(x, dtype=float) for x in (m7, m4, sizes))
+    return np.stack((1/m7, sizes/m7, sizes/m4, 1/m4), axis=-1)
+
+def load_points(mem, direction, measurements_path=MEASUREMENTS_PATH,
+                clocks=None, clock_lambda=lambda m7, m4: m4 >= 60,
+                size_lambda=lambda size: True):
+    '''Reads the mean latencies of every measured point of mem and direction
+    Args:
+        clocks: list of (m7, m4) to be read, every clock in the folder
+            matching clock_lambda if None
+    Returns: m7, m4, sizes, latency [us] arrays of the same length'''
+    mem_path = os.path.join(measurements_path, mem)
+    if clocks is None:
+        clocks = visu_common.get_clocks_in_folder(
+            mem_path, prefix=f'meas_{direction}_', clock_lambda=clock_lambda)
+    points, latencies = [], []
+    for m7, m4 in clocks:
+        dir_prefix = os.path.join(mem_path, f'meas_{direction}_{m7}_{m4}')
+        sizes = sorted(visu_common.get_sizes(dir_prefix, size_lambda=size_lambda))
+        # timer clock is always the same as the m4 core's clock
+        y = measurement.get_and_calc_meas(m4, dir_prefix, sizes, 'latency')
+        points.extend((m7, m4, size) for size in sizes)
+        latencies.append(y[0]) # mean
+    points = np.array(points, dtype=float).reshape((-1, 3))
+    latencies = np.hstack(latencies) if latencies else np.empty(0)
+    return points[:, 0], points[:, 1], points[:, 2], latencies
+
+def _fit_bounded(K, y):
+    '''Non-negative least squares fit of one problem'''
+    return scipy.optimize.lsq_linear(K, y, bounds=(0, np.inf)).x
+
+def fit_batch(problems):
+    '''Fits every problem at once with the normal equations, problems with
+        negative unconstrained parameters are fitted again with the
+        non-negative bound of the regression notebook
+    Args:
+        problems: dict of key to (K, y) design matrix and latencies
+    Returns: dict of key to np.array of the 4 parameters'''
+    keys = [key for key, (K, _) in problems.items() if len(K) >= 4]
+    if not keys:
+        return {}
+    lengths = np.array([len(problems[key][0]) for key in keys])
+    K_all = np.vstack([problems[key][0] for key in keys])
+    y_all = np.hstack([problems[key][1] for key in keys])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    # normal equations of all problems, shapes (B, 4, 4) and (B, 4)
+    KtK = np.add.reduceat(K_all[:, :, np.newaxis] * K_all[:, np.newaxis, :],
+                          starts, axis=0)
+    Kty = np.add.reduceat(K_all * y_all[:, np.newaxis], starts, axis=0)
+    # column scaling, the columns differ by orders of magnitude
+    scale = 1 / np.sqrt(np.diagonal(KtK, axis1=1, axis2=2))
+    try:
+        scaled = np.linalg.solve(
+            KtK * scale[:, :, np.newaxis] * scale[:, np.newaxis, :],
+            (Kty * scale)[..., np.newaxis])[..., 0]
+        params = scaled * scale
+    except np.linalg.LinAlgError: # singular problem, fitting one by one
+        params = np.full((len(keys), 4), -1.0)
+    result = {}
+    for i, key in enumerate(keys):
+        if np.all(params[i] >= 0):
+            result[key] = params[i]
+        else:
+            result[key] = _fit_bounded(*problems[key])
+    return result
+
+# prior variance of the parameters of the incremental fit [clk^2], weak
+# compared to the parameters, it only keeps the unmeasured directions open
+PRIOR_VARIANCE = 1e8
+
+def _scaled_inv(A):
+    '''Inverse of a symmetric matrix with columns of different magnitudes'''
+    scale = 1 / np.sqrt(np.diagonal(A))
+    return np.linalg.inv(A * scale[:, np.newaxis] * scale) \
+        * scale[:, np.newaxis] * scale
+
+class RecursiveLeastSquares():
+    '''Incremental least squares update of the model parameters, the
+        non-negative bound of the batch fit is not enforced by the updates,
+        only by bounded_params'''
+    def __init__(self, params, cov, clocks=()):
+        '''
+        Args:
+            params: the 4 model parameters
+            cov: inverse of the information matrix K^T K with the prior
+            clocks: (m7, m4) of the clock folders already in the fit'''
+        self.params = np.array(params, dtype=float)
+        self.cov = np.array(cov, dtype=float)
+        self.clocks = [tuple(clock) for clock in clocks]
+
+    @classmethod
+    def from_fit(cls, K, y, clocks=(), prior_variance=PRIOR_VARIANCE):
+        '''Starts from the least squares fit of K and y regularized by a
+            zero mean prior, the parameters are identified only in the
+            directions K measures, e.g. one clock folder leaves the split
+            between the m7 and m4 terms open for later folders
+        Args:
+            clocks: (m7, m4) of the clock folders of K'''
+        cov = _scaled_inv(K.T @ K + np.eye(K.shape[1]) / prior_variance)
+        return cls(cov @ (K.T @ y), cov, clocks)
+
+    def update(self, K, y):
+        '''Adds new rows K and latencies y to the fit'''
+        K, y = np.atleast_2d(K), np.atleast_1d(y)
+        innovation = np.eye(len(K)) + K @ self.cov @ K.T
+        gain = np.linalg.solve(innovation, K @ self.cov).T
+        self.params = self.params + gain @ (y - K @ self.params)
+        self.cov = self.cov - gain @ K @ self.cov
+        return self.params
+
+    def bounded_params(self):
+        '''Non-negative least squares solution of the same data, solved from
+            the state: the information matrix is inv(cov) and K^T y is
+            inv(cov) @ params, so the earlier rows are not needed
+        Returns: the 4 parameters'''
+        if np.all(self.params >= 0):
+            return self.params.copy()
+        information = _scaled_inv(self.cov)
+        Kty = information @ self.params
+        # column scaling, the columns differ by orders of magnitude
+        scale = 1 / np.sqrt(np.diagonal(information))
+        L = np.linalg.cholesky(information * scale[:, np.newaxis] * scale)
+        # |L^T x - L^-1 K^T y| has the minimum of |K x - y|
+        b = scipy.linalg.solve_triangular(L, Kty * scale, lower=True)
+        return scipy.optimize.lsq_linear(L.T, b, bounds=(0, np.inf)).x * scale
+
+    def to_dict(self):
+        '''Returns a json serializable state'''
+        return {'params': self.params.tolist(), 'cov': self.cov.tolist(),
+                'clocks': [[int(m7), int(m4)] for m7, m4 in self.clocks]}
+
+    @classmethod
+    def from_dict(cls, state):
+        '''Creates the state from to_dict output'''
+        return cls(state['params'], state['cov'], state.get('clocks', ()))
+
+def _state_path(json_path):
+    '''Returns the file of the incremental fit state next to the model'''
+    return json_path.replace('.json', '_rls.json')
+
+def _write_json(path, content):
+    '''Writes the json through a temporary file'''
+    with open(path + '.tmp', 'w') as file:
+        json.dump(content, file, indent=4)
+    os.replace(path + '.tmp', path)
+
+def fit_models(json_path, mems=None, directions=('s', 'r'),
+               measurements_path=MEASUREMENTS_PATH,
+               clock_lambda=lambda m7, m4: m4 >= 60,
+               size_lambda=lambda size: True):
+    '''Fits the model of every mem and direction in one batch and writes the
+        parameters and the state for the incremental updates
+    Returns: the parameters in the structure of the json'''
+    if mems is None:
+        mems = visu_common.get_mems(measurements_path)
+    problems, clocks = {}, {}
+    for mem in mems:
+        for direction in directions:
+            m7, m4, sizes, y = load_points(mem, direction, measurements_path,
+                                           clock_lambda=clock_lambda,
+                                           size_lambda=size_lambda)
+            problems[(mem, direction)] = (design_matrix(m7, m4, sizes), y)
+            clocks[(mem, direction)] = sorted(set(zip(m7.astype(int),
+                                                      m4.astype(int))))
+    fitted = fit_batch(problems)
+
+    identified_params, state = {}, {}
+    for (mem, direction), params in fitted.items():
+        # direction under mem in the dict
+        identified_params.setdefault(mem, {})[direction] = list(params)
+        # unconstrained, so the state matches its covariance
+        rls = RecursiveLeastSquares.from_fit(*problems[(mem, direction)],
+                                             clocks[(mem, direction)])
+        state.setdefault(mem, {})[direction] = rls.to_dict()
+    _write_json(json_path, identified_params)
+    _write_json(_state_path(json_path), state)
+    return identified_params
+
+def add_clock_dir(json_path, mem, direction, m7, m4,
+                  measurements_path=MEASUREMENTS_PATH,
+                  size_lambda=lambda size: True):
+    '''Updates the model of mem and direction with a newly measured clock
+        folder without refitting the earlier measurements, a folder already
+        in the fit is skipped
+    Returns: the updated non-negative parameters'''
+    with open(json_path, 'r') as file:
+        identified_params = json.load(file)
+    with open(_state_path(json_path), 'r') as file:
+        state = json.load(file)
+    _, _, sizes, y = load_points(mem, direction, measurements_path,
+                                 clocks=[(m7, m4)], size_lambda=size_lambda)
+    K = design_matrix(np.full(len(sizes), m7), np.full(len(sizes), m4), sizes)
+    if mem in state and direction in state[mem]:
+        rls = RecursiveLeastSquares.from_dict(state[mem][direction])
+        if (m7, m4) in rls.clocks: # its points would be counted twice
+            print(f'{mem} {direction} {m7}_{m4} is already in the model')
+            return rls.bounded_params()
+        rls.update(K, y)
+        rls.clocks.append((m7, m4))
+    else: # first clock folder of a new model, only partly identified
+        rls = RecursiveLeastSquares.from_fit(K, y, [(m7, m4)])
+    # the json holds the non-negative fit like fit_models, the state stays
+    # unconstrained
+    params = rls.bounded_params()
+    identified_params.setdefault(mem, {})[direction] = params.tolist()
+    state.setdefault(mem, {})[direction] = rls.to_dict()
+    _write_json(json_path, identified_params)
+    _write_json(_state_path(json_path), state)
+    return params
+
+if __name__ == '__main__':
+    print(fit_models(os.path.join(MODELS_PATH, 'models_long.json')))
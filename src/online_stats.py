@@ -0,0 +1,124 @@
+import json
+import numpy as np
+
+import cycle_hist
+
+class OnlineStats():
+    '''Streaming statistics of integer clk samples: count, mean, variance
+        (Welford), min, max and an exact histogram, mergeable across runs,
+        the histogram is sparse, so outliers far from the rest cost one bin'''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared differences from the mean
+        self._hist = cycle_hist.CycleHistogram()
+        self._pending = {} # samples of add() not merged into the histogram
+
+    def add(self, sample):
+        '''Adds one sample'''
+        sample = int(sample)
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (sample - self.mean)
+        self._pending[sample] = self._pending.get(sample, 0) + 1
+
+    def add_batch(self, samples):
+        '''Adds an array of samples'''
+        samples = np.asarray(samples, dtype=np.int64).ravel()
+        if samples.size == 0:
+            return
+        batch = OnlineStats()
+        batch.count = samples.size
+        batch.mean = float(np.mean(samples))
+        batch.m2 = float(np.sum(np.square(samples - batch.mean)))
+        batch._hist = cycle_hist.CycleHistogram.from_samples(samples)
+        self.merge(batch)
+
+    def merge(self, other):
+        '''Adds the samples summarized by other, e.g. of another run or board'''
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self._hist = self.to_histogram().merge(other.to_histogram())
+        return self
+
+    def to_histogram(self):
+        '''Returns the histogram as a cycle_hist.CycleHistogram'''
+        if self._pending:
+            values = np.fromiter(self._pending.keys(), dtype=np.int64)
+            counts = np.fromiter(self._pending.values(), dtype=np.int64)
+            self._pending = {}
+            self._hist = self._hist.merge(cycle_hist.CycleHistogram(
+                values, counts))
+        return self._hist
+
+    @property
+    def variance(self):
+        '''Population variance like np.var'''
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        '''Population std like np.std'''
+        return np.sqrt(self.variance)
+
+    @property
+    def min(self):
+        '''Smallest sample, nan if there are no samples'''
+        return self.to_histogram().min if self.count else np.nan
+
+    @property
+    def max(self):
+        '''Largest sample, nan if there are no samples'''
+        return self.to_histogram().max if self.count else np.nan
+
+    def quantile(self, q):
+        '''Returns the smallest sample with at least q of the samples at or
+            below it, nan if there are no samples'''
+        if self.count == 0:
+            return np.nan
+        return int(self.to_histogram().quantile(q))
+
+    def to_dict(self):
+        '''Returns a json serializable summary'''
+        hist = self.to_histogram()
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'values': hist.values.tolist(), 'counts': hist.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, summary):
+        '''Creates the statistics from to_dict output'''
+        stats = cls()
+        stats.count = summary['count']
+        stats.mean = summary['mean']
+        stats.m2 = summary['m2']
+        stats._hist = cycle_hist.CycleHistogram(summary['values'],
+                                                summary['counts'])
+        return stats
+
+    def save(self, path):
+        '''Writes the summary to a json file'''
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path):
+        '''Reads a summary written by save'''
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+def calc_from_stats(all_stats, timer_clock, sizes, meas_type):
+    '''Same as measurement.get_and_calc_meas, from summaries of the samples
+    Args:
+        all_stats: list of OnlineStats for each size
+    Returns:
+        np.array(mean, min, max), shape: (3, len(sizes))'''
+    import measurement # measurement uses this module as well
+    summaries = np.array([(stats.mean, stats.min, stats.max)
+                          for stats in all_stats]).reshape((-1, 3)).T
+    return measurement.calc_meas(summaries, timer_clock, sizes, meas_type)
@@ -1,7 +1,11 @@
 import os
-ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the data folders can be moved with the env var, e.g. for synthetic data
+ROOT_PATH = os.environ.get('IPC_VISU_ROOT',
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 MODELS_PATH = os.path.join(ROOT_PATH, 'models')
 FIGURES_PATH = os.path.join(ROOT_PATH, 'figures')
 MEASUREMENTS_PATH = os.path.join(ROOT_PATH, 'measurements')
 PILOT_PATH = os.path.join(MEASUREMENTS_PATH, 'pilot')
+CACHE_PATH = os.path.join(ROOT_PATH, 'cache')
+STORE_PATH = os.path.join(MEASUREMENTS_PATH, 'campaign')
@@ -0,0 +1,113 @@
+import os
+import glob
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+
+# path of the trace file, tracing is off if the env var is not set when
+# the modules are imported
+TRACE_ENV = 'IPC_VISU_TRACE'
+TRACE_PATH = os.environ.get(TRACE_ENV)
+ENABLED = bool(TRACE_PATH)
+
+_events = []
+_counters = {}
+_counter_lock = threading.Lock()
+_null_span = contextlib.nullcontext()
+# forked worker processes keep the pid of the main process here, workers
+# started with spawn (the only method on Windows) import the module again,
+# take themselves for the main process and their events are not reported
+_main_pid = os.getpid()
+
+def _now():
+    '''Timestamp of the events [us]'''
+    return time.perf_counter_ns() / 1000
+
+def _reset():
+    '''Forked workers start with empty events, the parent saves its own'''
+    _events.clear()
+    _counters.clear()
+
+@contextlib.contextmanager
+def _span(name, args):
+    '''Appends a complete event of the block'''
+    start = _now()
+    try:
+        yield
+    finally:
+        _events.append({'name': name, 'ph': 'X', 'ts': start,
+                        'dur': _now() - start, 'pid': os.getpid(),
+                        'tid': threading.get_ident(), 'args': args})
+
+def span(name, **args):
+    '''Context manager timing the block, spans nest by their time, args are
+        shown in the viewer'''
+    if not ENABLED:
+        return _null_span
+    return _span(name, args)
+
+def traced(func=None, *, name=None):
+    '''Decorator timing every call of the function, the function is
+        returned unchanged if tracing is off'''
+    if func is None:
+        return functools.partial(traced, name=name)
+    if not ENABLED:
+        return func
+    span_name = name or func.__qualname__
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _span(span_name, {}):
+            return func(*args, **kwargs)
+    return wrapper
+
+def count(name, value=1):
+    '''Adds value to the counter, the running totals are in the trace'''
+    if not ENABLED:
+        return
+    with _counter_lock:
+        total = _counters.get(name, 0) + value
+        _counters[name] = total
+    _events.append({'name': name, 'ph': 'C', 'ts': _now(),
+                    'pid': os.getpid(), 'args': {name: total}})
+
+def flush():
+    '''Writes the events of a forked worker process next to the trace
+        file, the main process merges them when it saves the trace, spawned
+        workers do not write their events'''
+    if not ENABLED or os.getpid() == _main_pid:
+        return
+    # only the events since the last flush are appended, one line each
+    # flush, the counters of the last line are the totals
+    events = _events[:]
+    del _events[:len(events)]
+    with open(f'{TRACE_PATH}.{os.getpid()}.part', 'a') as file:
+        file.write(json.dumps({'events': events, 'counters': _counters}))
+        file.write('\n')
+
+def save():
+    '''Writes the trace in the Chrome trace-event format, the workers'
+        events and counters are merged'''
+    if os.getpid() != _main_pid:
+        return
+    events, counters = list(_events), dict(_counters)
+    for part in glob.glob(f'{glob.escape(TRACE_PATH)}.*.part'):
+        with open(part, 'r') as file:
+            flushes = [json.loads(line) for line in file]
+        os.remove(part)
+        for worker in flushes:
+            events.extend(worker['events'])
+        for name, value in flushes[-1]['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    tmp_path = f'{TRACE_PATH}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                   'otherData': {'counters': counters}}, file)
+    os.replace(tmp_path, TRACE_PATH)
+
+if ENABLED:
+    atexit.register(save)
+    if hasattr(os, 'register_at_fork'): # not on Windows
+        os.register_at_fork(after_in_child=_reset)
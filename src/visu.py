@@ -7,12 +7,15 @@ from setup_paths import *
 import measurement
 import linear_model
 import visu_common
+import tracing
 
+@tracing.traced
 def model_plot(sizes, data, m7, m4, mem, color, if_label=False):
     '''Plot for data in function of size, formatted for the model'''
     plt.plot(sizes, data, alpha=0.5, linestyle='dashed', color=color,
              label=(f'{mem}pred, {m7}, {m4}' if if_label else None))
 
+@tracing.traced
 def errorbars(configs, sizes, data, cmap, if_line=True):
     '''Errorbar plot for several clock frequency, latency mesaurement
     Inputs:
@@ -42,6 +45,7 @@ def setup_errorbars(meas_type, direction):
     plt.ylabel(f'{meas_type.capitalize()} [{unit}]')
     plt.xlabel('Data size [B]')
 
+@tracing.traced
 def final_size_func_foreach(configs, meas_type, direction, if_model=False,
                             size_lambda=lambda size: size < 260):
     '''Draws complete final plot for each config'''
@@ -53,7 +57,12 @@ def final_size_func_foreach(configs, meas_type, direction, if_model=False,
     # sizes = [1 if x==0 else 16*x for x in range(17)] # [2048*x for x in range(17)]
     sizes = sorted(visu_common.get_sizes(size_dir, size_lambda=size_lambda))
     if if_model:
-        model = linear_model.LinearModel(model_path, mem, direction)
+        # predictions for all configs at once
+        registry = linear_model.ModelRegistry(model_path)
+        preds = registry.get_output_points(
+            [config['mem'] for config in configs], direction,
+            [config['clk'][0] for config in configs],
+            [config['clk'][1] for config in configs], sizes, meas_type)
 
     data = np.ndarray((len(configs), 3, len(sizes)))
     for i, config in enumerate(configs):
@@ -61,9 +70,7 @@ def final_size_func_foreach(configs, meas_type, direction, if_model=False,
         dir = os.path.join(MEASUREMENTS_PATH, mem, f'meas_{direction}_{m7}_{m4}')
         data[i] = measurement.get_and_calc_meas(m4, dir, sizes, meas_type)
         if if_model:
-            model.set_model(mem, direction)
-            pred = model.get_output(m7, m4, sizes, meas_type)
-            model_plot(sizes, pred, m7, m4, mem, cmap[i])
+            model_plot(sizes, preds[i], m7, m4, mem, cmap[i])
     data = measurement.upper_lower_from_minmax(data)
     errorbars(configs, sizes, data, cmap, if_line=(not if_model))
     setup_errorbars(meas_type, direction)
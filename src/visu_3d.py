@@ -7,6 +7,7 @@ from setup_paths import *
 import measurement
 import visu_common
 import linear_model
+import tracing
 
 def errorbar_3dfull(clocks, data, size, meas_type, direction='s', 
                      mem_domain='D1', title=True, color='b'):
@@ -34,6 +35,7 @@ def errorbar_3dfull(clocks, data, size, meas_type, direction='s',
     ax.set_ylim([0, 240])
     ax.set_zlim(0)
 
+@tracing.traced
 def errorbar_3d(clocks, data, ax, label, color):
     ''' 3d plot without figure and annotation
     Inputs:
@@ -66,6 +68,7 @@ def setup_ax(ax, direction, meas_type, size):
     ax.set_zlim(0)
     ax.legend()
 
+@tracing.traced
 def model_grid(m7, m4, pred, ax, color, if_cut=False, stride=34):
     '''3d plot without figure and annotation
     Grid for the clocks and using it for a wireframe for pred
@@ -87,6 +90,7 @@ def model_grid(m7, m4, pred, ax, color, if_cut=False, stride=34):
     ax.plot_wireframe(m7_grid, m4_grid, pred, rstride=stride, cstride=stride,
                       color=color, zorder=2, linestyle='dashed')
 
+@tracing.traced
 def final3d_foreach(size, mems, direction, ax, meas_type='latency',
                    clock_lambda=lambda _,m4: m4>=60, if_cut=False, stride=34):
     '''Draw the 3d plots for the given size and mems